@@ -40,7 +40,7 @@ class ClassificationIndex:
 
     def get_records_in_classification(self, classification: str) -> List:
         """
-        Return the first 80 records in a given classification
+        Return all records in a given classification
         :param classification: Name of classification
         :returns: List of records associated with the classification
         """
@@ -57,6 +57,7 @@ class ClassificationIndex:
         """
 
         if self.data is not None:
-            return self.data.get("reverse_index", {}).get(record_id)
+            # json only has string keys
+            return self.data.get("reverse_index", {}).get(str(record_id))
 
         return None
@@ -0,0 +1,211 @@
+import json
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+from src.dir_utils.dirs import get_app_data_dir
+
+
+def format_year(year: int) -> str:
+    """
+    Format a begin date for display, the CSV uses negative years for BC
+    """
+    if year < 0:
+        return f"{-year} BC"
+
+    return str(year)
+
+
+class ClassificationDates:
+    """
+    The records of one classification sorted by begin date, with the histogram bins precomputed by
+    utils/classifications_builder.py. prefix[i] is the number of records dated before edges[i], so the count and
+    the records of any range of bins are a subtraction and a slice
+    """
+
+    def __init__(
+        self, ids: List[int], dates: List[int], edges: List[int], prefix: List[int]
+    ) -> None:
+        """
+        :param ids: Record IDs sorted by begin date
+        :param dates: Begin dates of the records, in the same order
+        :param edges: Edges of the histogram bins, bin i covers edges[i] up to (not including) edges[i + 1]
+        :param prefix: Number of records dated before every edge
+        """
+        self.ids = array("i", ids)
+        self.dates = array("i", dates)
+        self.edges = edges
+        self.prefix = prefix
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def bin_count(self) -> int:
+        return len(self.edges) - 1
+
+    def bin_counts(self) -> List[int]:
+        """
+        Number of records in every bin
+        """
+        return [b - a for a, b in zip(self.prefix, self.prefix[1:])]
+
+    def count_bins(self, start: int, end: int) -> int:
+        """
+        Number of records in a range of bins, in constant time
+
+        :param start: First bin
+        :param end: Bin after the last one
+        :returns: Record count
+        """
+        return self.prefix[end] - self.prefix[start]
+
+    def ids_in_bins(self, start: int, end: int) -> array:
+        """
+        Records in a range of bins
+
+        :param start: First bin
+        :param end: Bin after the last one
+        :returns: array('i') of record IDs sorted by begin date
+        """
+        return self.ids[self.prefix[start] : self.prefix[end]]
+
+    def count_between(self, begin: int, end: int) -> int:
+        """
+        Number of records dated in any range, for ranges that don't line up with the bins
+
+        :param begin: First year
+        :param end: Year after the last one
+        :returns: Record count
+        """
+        return bisect_left(self.dates, end) - bisect_left(self.dates, begin)
+
+    def ids_between(self, begin: int, end: int) -> array:
+        """
+        Records dated in any range
+
+        :param begin: First year
+        :param end: Year after the last one
+        :returns: array('i') of record IDs sorted by begin date
+        """
+        return self.ids[bisect_left(self.dates, begin) : bisect_left(self.dates, end)]
+
+    def bin_label(self, start: int, end: int) -> str:
+        """
+        Human readable years of a range of bins
+        """
+        first, last = self.edges[start], self.edges[end] - 1
+        if first == last:
+            return format_year(first)
+
+        return f"{format_year(first)} – {format_year(last)}"
+
+
+class DateIndex:
+    """
+    Begin dates of the records of every classification, so the results can be narrowed down to a period without
+    fetching anything
+    """
+
+    def __init__(self, index_path=None) -> None:
+        if index_path is None:
+            # Default to our index path
+            index_path = get_app_data_dir() / "date_index.json"
+
+        self.index_path = Path(index_path)
+        self.data = self.load_index()
+        # Classifications are converted to arrays the first time they are used
+        self.classifications: Dict[str, ClassificationDates] = {}
+        # Begin date of every dated record sorted by record ID, for records that don't come from one classification
+        self._all_ids = None
+        self._all_dates = None
+
+    @property
+    def available(self) -> bool:
+        """
+        False if the index has not been built
+        """
+        return bool(self.data)
+
+    def load_index(self) -> Dict:
+        """
+        Load the index file, a missing index just disables the histogram
+        :returns: Dictionary of classifications and their dates
+        """
+        if not self.index_path.exists():
+            logger.info("No date index found, the date histogram is disabled")
+            return {}
+
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def get(self, classification: str) -> Optional[ClassificationDates]:
+        """
+        Get the dates of a classification
+
+        :param classification: Name of the classification
+        :returns: The classification's dates or None if it has no dated records
+        """
+        dates = self.classifications.get(classification)
+        if dates is None and classification in self.data:
+            entry = self.data[classification]
+            dates = ClassificationDates(
+                entry["ids"], entry["dates"], entry["edges"], entry["prefix"]
+            )
+            self.classifications[classification] = dates
+
+        return dates
+
+    def _date_lookup(self) -> tuple[array, array]:
+        """
+        Record IDs and begin dates of all classifications sorted by ID, built the first time it's needed
+        """
+        if self._all_ids is None:
+            pairs = sorted(
+                (record_id, date)
+                for entry in self.data.values()
+                for record_id, date in zip(entry["ids"], entry["dates"])
+            )
+            self._all_ids = array("i", (record_id for record_id, _ in pairs))
+            self._all_dates = array("i", (date for _, date in pairs))
+
+        return self._all_ids, self._all_dates
+
+    def sort_by_date(
+        self,
+        record_ids: Iterable[int],
+        classification: Optional[str] = None,
+        descending: bool = False,
+    ) -> List[int]:
+        """
+        Order records by begin date, so they can be fetched in the order they are shown. Records without a date
+        come last, in the order they were given
+
+        :param record_ids: Record IDs to order
+        :param classification: Classification all of the records belong to, its dates are already in order
+        :param descending: Latest first
+        :returns: Ordered record IDs
+        """
+        record_ids = list(record_ids)
+        wanted = set(record_ids)
+
+        dates = self.get(classification) if classification else None
+        if dates is not None:
+            ordered = [r for r in dates.ids if r in wanted]
+        else:
+            all_ids, all_dates = self._date_lookup()
+            dated = []
+            for record_id in wanted:
+                position = bisect_left(all_ids, record_id)
+                if position < len(all_ids) and all_ids[position] == record_id:
+                    dated.append((all_dates[position], record_id))
+
+            dated.sort()
+            ordered = [record_id for _, record_id in dated]
+
+        if descending:
+            ordered.reverse()
+
+        dated_ids = set(ordered)
+        return ordered + [r for r in record_ids if r not in dated_ids]
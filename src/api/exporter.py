@@ -0,0 +1,322 @@
+import csv
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from loguru import logger
+from src.api.image_availability import ImageAvailabilityIndex
+from src.api.met_api import MetAPI, RecordNotFoundError
+from src.api.rate_limiter import RateLimiter
+from src.api.record_store import RecordStore
+from src.api.shared_files import temporary_path
+
+# Records are read from the store and written out in chunks of this size, this is what bounds the memory use
+CHUNK_SIZE = 500
+
+# Flat columns for tabular formats. Nested values (lists, constituents) are stored as JSON strings
+EXPORT_FIELDS = [
+    "objectID",
+    "accessionNumber",
+    "accessionYear",
+    "isHighlight",
+    "isPublicDomain",
+    "primaryImage",
+    "primaryImageSmall",
+    "additionalImages",
+    "constituents",
+    "department",
+    "objectName",
+    "title",
+    "culture",
+    "period",
+    "dynasty",
+    "reign",
+    "portfolio",
+    "artistRole",
+    "artistDisplayName",
+    "artistDisplayBio",
+    "artistNationality",
+    "artistBeginDate",
+    "artistEndDate",
+    "objectDate",
+    "objectBeginDate",
+    "objectEndDate",
+    "medium",
+    "dimensions",
+    "measurements",
+    "creditLine",
+    "geographyType",
+    "city",
+    "state",
+    "county",
+    "country",
+    "region",
+    "classification",
+    "rightsAndReproduction",
+    "linkResource",
+    "metadataDate",
+    "repository",
+    "objectURL",
+    "tags",
+    "objectWikidata_URL",
+    "isTimelineWork",
+    "GalleryNumber",
+]
+
+INTEGER_FIELDS = {"objectID", "objectBeginDate", "objectEndDate"}
+BOOLEAN_FIELDS = {"isHighlight", "isPublicDomain", "isTimelineWork"}
+
+
+def iter_records(
+    record_ids: Iterable[int],
+    store: RecordStore,
+    api: MetAPI,
+    limiter: Optional[RateLimiter] = None,
+    cancel_event: Optional[threading.Event] = None,
+    image_availability: Optional[ImageAvailabilityIndex] = None,
+) -> Iterator[Dict]:
+    """
+    Yield full records in order, reading from the store and falling back to the API. Records fetched from the API
+    are added to the store. Only one chunk of records is held in memory at a time
+
+    :param record_ids: IDs of the records to export
+    :param store: Local record store
+    :param api: API used for records that are not stored yet
+    :param limiter: Rate limiter for API requests
+    :param cancel_event: Event that stops the export when set
+    :param image_availability: When given only records with a displayable image are yielded. The API marks records
+        as having images that turn out not to have one, so every record we read is verified on the way
+    :returns: Iterator of record data
+    """
+    limiter = limiter or RateLimiter()
+    chunk = []
+
+    for record_id in record_ids:
+        chunk.append(int(record_id))
+        if len(chunk) >= CHUNK_SIZE:
+            yield from _iter_chunk(
+                chunk, store, api, limiter, cancel_event, image_availability
+            )
+            chunk = []
+
+    if chunk:
+        yield from _iter_chunk(
+            chunk, store, api, limiter, cancel_event, image_availability
+        )
+
+
+def _iter_chunk(
+    chunk, store, api, limiter, cancel_event, image_availability
+) -> Iterator[Dict]:
+    """
+    Yield the records of a single chunk, see iter_records
+    """
+    stored = store.get_many(chunk)
+
+    for record_id in chunk:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+
+        record = stored.pop(record_id, None)
+
+        if record is None:
+            try:
+                record = api.get_single_record_with_retries(
+                    record_id, limiter, cancel_event=cancel_event
+                )
+            except RecordNotFoundError:
+                logger.warning(f"Skipping record {record_id}, it does not exist")
+                if image_availability is not None:
+                    image_availability.mark_missing(record_id)
+                continue
+
+            store.put(record)
+
+        if image_availability is not None:
+            image_availability.update_from_record(record)
+            if not record.get("primaryImageSmall"):
+                continue
+
+        yield record
+
+
+def flatten(record: Dict) -> Dict:
+    """
+    Turn a record into a flat row with the export columns
+
+    :param record: Record data
+    :returns: Row with scalar values only
+    """
+    row = {}
+    for field in EXPORT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value)
+
+        row[field] = value
+
+    return row
+
+
+class JsonlWriter:
+    """
+    Write one full record per line
+    """
+
+    def __init__(self, path) -> None:
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: Dict):
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    """
+    Write flattened records as CSV rows
+    """
+
+    def __init__(self, path) -> None:
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=EXPORT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record: Dict):
+        self.writer.writerow(flatten(record))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Write flattened records as a columnar Parquet file, one row group per chunk. Needs pyarrow
+    (``pip install metbrowser[parquet]``)
+    """
+
+    def __init__(self, path) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Parquet export needs pyarrow, install it with `uv sync --extra parquet`"
+            )
+
+        self.pa = pa
+        fields = []
+        for field in EXPORT_FIELDS:
+            if field in INTEGER_FIELDS:
+                fields.append(pa.field(field, pa.int64()))
+            elif field in BOOLEAN_FIELDS:
+                fields.append(pa.field(field, pa.bool_()))
+            else:
+                fields.append(pa.field(field, pa.string()))
+
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(str(path), self.schema)
+        self.rows: List[Dict] = []
+
+    def write(self, record: Dict):
+        row = flatten(record)
+        for field in EXPORT_FIELDS:
+            value = row[field]
+            if field in INTEGER_FIELDS or field in BOOLEAN_FIELDS or value is None:
+                continue
+
+            row[field] = str(value)
+
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            self.writer.write_table(table)
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def export_records(
+    record_ids: List[int],
+    path,
+    export_format: Optional[str] = None,
+    store: Optional[RecordStore] = None,
+    api: Optional[MetAPI] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    limiter: Optional[RateLimiter] = None,
+    image_availability: Optional[ImageAvailabilityIndex] = None,
+) -> int:
+    """
+    Stream records into a file. It's written under a temporary name and only replaces the target once every record
+    is written, so a cancelled or failed export never leaves a partial file behind
+
+    :param record_ids: IDs of the records to export
+    :param path: Output file
+    :param export_format: One of jsonl, csv or parquet. Taken from the file extension by default
+    :param store: Local record store
+    :param api: API used for records that are not stored yet
+    :param progress_callback: Called with the number of records written and the total
+    :param cancel_event: Event that stops the export when set
+    :param limiter: Rate limiter for API requests, e.g. the app wide one
+    :param image_availability: When given records without a displayable image are left out, see iter_records
+    :returns: Number of records written
+    """
+    path = Path(path)
+    export_format = export_format or path.suffix.lstrip(".").lower()
+    if export_format not in WRITERS:
+        raise ValueError(
+            f"Unknown export format {export_format}, use one of {', '.join(WRITERS)}"
+        )
+
+    store = store or RecordStore()
+    api = api or MetAPI()
+    total = len(record_ids)
+    written = 0
+
+    tmp_path = temporary_path(path)
+    try:
+        writer = WRITERS[export_format](tmp_path)
+        try:
+            for record in iter_records(
+                record_ids,
+                store,
+                api,
+                limiter=limiter,
+                cancel_event=cancel_event,
+                image_availability=image_availability,
+            ):
+                writer.write(record)
+                written += 1
+
+                if progress_callback:
+                    progress_callback(written, total)
+        finally:
+            writer.close()
+
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info(f"Export to {path} cancelled")
+            return written
+
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    logger.info(f"Exported {written} records to {path}")
+    return written
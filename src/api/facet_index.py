@@ -0,0 +1,211 @@
+import json
+import struct
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from src.api.id_set import IdSet, intersect_all
+from src.api.shared_files import atomic_write
+from src.dir_utils.dirs import get_app_data_dir
+
+MAGIC = b"MFAC"
+VERSION = 1
+# magic, version, length of the json header
+HEADER = struct.Struct("<4sII")
+# The columns of the CSV we can browse by
+FACETS = ("department", "classification", "artist", "culture")
+
+
+def write_facet_index(path, facets: Dict[str, Dict[str, List[int]]]):
+    """
+    Write the posting lists of every facet. A json header describes where everything is, followed by one block of
+    32 bit ints: all record IDs, the sorted posting list of every value and, per facet, the values of every record
+    (offsets into a flat list, since records can have several artists)
+
+    :param path: Output file
+    :param facets: Dictionary of facets, with the record IDs of every value
+    """
+    blob = array("i")
+
+    def append(ids) -> List[int]:
+        # Position and length of a block in the blob
+        segment = [len(blob), len(ids)]
+        blob.extend(ids)
+        return segment
+
+    record_ids = sorted(
+        {r for values in facets.values() for ids in values.values() for r in ids}
+    )
+    positions = {record_id: i for i, record_id in enumerate(record_ids)}
+    header = {"record_ids": append(record_ids), "facets": {}}
+
+    for facet, values in facets.items():
+        names = sorted(values)
+        record_values = [[] for _ in record_ids]
+        postings = []
+        for index, name in enumerate(names):
+            ids = sorted(set(values[name]))
+            postings.append(append(ids))
+            for record_id in ids:
+                record_values[positions[record_id]].append(index)
+
+        offsets = [0]
+        flat = []
+        for indexes in record_values:
+            flat.extend(indexes)
+            offsets.append(len(flat))
+
+        header["facets"][facet] = {
+            "values": names,
+            "postings": postings,
+            "offsets": append(offsets),
+            "record_values": append(flat),
+        }
+
+    data = json.dumps(header).encode("utf-8")
+    with atomic_write(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        f.write(data)
+        blob.tofile(f)
+
+
+class FacetIndex:
+    """
+    Posting lists of the department, classification, artist and culture of every record, built from the open
+    access CSV by utils/classifications_builder.py. Any combination of them is answered by intersecting sorted ID
+    arrays, and the counts of a facet within a result come from a per record lookup, so browsing never fetches
+    anything
+    """
+
+    def __init__(self, index_path=None) -> None:
+        if index_path is None:
+            # Default to our index path
+            index_path = get_app_data_dir() / "facet_index.bin"
+
+        self.index_path = Path(index_path)
+        self.header = {}
+        self.blob = array("i")
+        self.record_ids = array("i")
+        self.value_positions = {}
+        self.load_index()
+
+    @property
+    def available(self) -> bool:
+        """
+        False if the index has not been built
+        """
+        return bool(self.header)
+
+    def load_index(self):
+        """
+        Load the posting lists, a missing index just disables browsing by facet
+        """
+        if not self.index_path.exists():
+            logger.info("No facet index found, browsing by department is disabled")
+            return
+
+        with open(self.index_path, "rb") as f:
+            magic, version, header_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                logger.error(f"Unsupported facet index {self.index_path}")
+                return
+
+            header = json.loads(f.read(header_length))
+            self.blob.frombytes(f.read())
+
+        self.header = header
+        self.record_ids = self.segment(header["record_ids"])
+        # Value name -> position in the facet's list, per facet
+        self.value_positions = {
+            facet: {name: i for i, name in enumerate(entry["values"])}
+            for facet, entry in header["facets"].items()
+        }
+
+    def segment(self, segment: List[int]) -> array:
+        """
+        Copy a block out of the blob
+        """
+        start, length = segment
+        return self.blob[start : start + length]
+
+    def values(self, facet: str) -> List[str]:
+        """
+        All values of a facet
+
+        :param facet: Name of the facet
+        :returns: Sorted list of values
+        """
+        if not self.available:
+            return []
+
+        return self.header["facets"][facet]["values"]
+
+    def postings(self, facet: str, value: str) -> IdSet:
+        """
+        Records with a value
+
+        :param facet: Name of the facet
+        :param value: Value of the facet
+        :returns: Set of record IDs, empty for unknown values
+        """
+        position = self.value_positions.get(facet, {}).get(value)
+        if position is None:
+            return IdSet()
+
+        segment = self.header["facets"][facet]["postings"][position]
+        return IdSet._from_sorted(self.segment(segment))
+
+    def query(self, filters: Dict[str, str]) -> IdSet:
+        """
+        Records matching all filters
+
+        :param filters: Dictionary of facets and the value they must have
+        :returns: Set of record IDs, all records if there are no filters
+        """
+        if not filters:
+            return IdSet._from_sorted(self.record_ids)
+
+        return intersect_all(
+            [self.postings(facet, value) for facet, value in filters.items()]
+        )
+
+    def counts(self, facet: str, within: Optional[IdSet] = None) -> Dict[str, int]:
+        """
+        Number of records of every value of a facet
+
+        :param facet: Name of the facet
+        :param within: Only count these records, e.g. the result of a query. All records by default
+        :returns: Dictionary of values and their record counts, values without records are left out
+        """
+        if not self.available:
+            return {}
+
+        entry = self.header["facets"][facet]
+        if within is None:
+            return {
+                name: length
+                for name, (_, length) in zip(entry["values"], entry["postings"])
+            }
+
+        # Look up the values of every record, that only costs as much as the result is large
+        offsets_start = entry["offsets"][0]
+        values_start = entry["record_values"][0]
+        blob = self.blob
+        counts = Counter()
+        position = 0
+        for record_id in within:
+            position = bisect_left(self.record_ids, record_id, position)
+            if position == len(self.record_ids):
+                break
+
+            if self.record_ids[position] != record_id:
+                continue
+
+            start = blob[offsets_start + position]
+            end = blob[offsets_start + position + 1]
+            counts.update(blob[values_start + start : values_start + end])
+
+        names = entry["values"]
+        return {names[index]: count for index, count in counts.items()}
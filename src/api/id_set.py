@@ -0,0 +1,298 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, the pure python merges are fine, just slower
+    np = None
+
+# The key of the id list in the API's responses
+OBJECT_IDS_KEY = b'"objectIDs"'
+# When one set is this many times larger than the other, intersections search the small set's IDs in the large one
+# instead of walking both
+GALLOP_RATIO = 16
+
+
+class IdSet:
+    """
+    Compact, immutable set of record IDs stored as a sorted array of 32 bit ints (4 bytes per ID instead of the
+    ~60 a python set needs). Set operations are linear merges (galloping searches when one set is much smaller),
+    done with numpy when it's installed
+    """
+
+    def __init__(self, record_ids: Iterable[int] = ()) -> None:
+        """
+        :param record_ids: Record IDs in any order, duplicates are dropped
+        """
+        if isinstance(record_ids, IdSet):
+            self._ids = record_ids._ids
+        else:
+            self._ids = array("i", sorted(set(record_ids)))
+
+    @classmethod
+    def from_array(cls, ids: array) -> "IdSet":
+        """
+        Build a set from an array of IDs without going through python ints when possible
+
+        :param ids: array('i') of record IDs in any order
+        :returns: The ID set
+        """
+        if np is not None:
+            return cls._from_numpy(np.unique(np.frombuffer(ids, dtype=np.int32)))
+
+        return cls(ids)
+
+    @classmethod
+    def _from_sorted(cls, ids: array) -> "IdSet":
+        """
+        Wrap an array that is already sorted and unique
+        """
+        id_set = cls.__new__(cls)
+        id_set._ids = ids
+        return id_set
+
+    @classmethod
+    def _from_numpy(cls, values) -> "IdSet":
+        """
+        Wrap a sorted and unique numpy array
+        """
+        ids = array("i")
+        ids.frombytes(values.astype(np.int32).tobytes())
+        return cls._from_sorted(ids)
+
+    def _numpy(self):
+        """
+        Zero copy numpy view of the IDs
+        """
+        return np.frombuffer(self._ids, dtype=np.int32)
+
+    @staticmethod
+    def _coerce(other) -> "IdSet":
+        return other if isinstance(other, IdSet) else IdSet(other)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, record_id) -> bool:
+        i = bisect_left(self._ids, record_id)
+        return i < len(self._ids) and self._ids[i] == record_id
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IdSet):
+            return NotImplemented
+
+        return self._ids == other._ids
+
+    def __repr__(self) -> str:
+        return f"IdSet({len(self)} ids)"
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the IDs
+        """
+        return self._ids.itemsize * len(self._ids)
+
+    def tolist(self) -> list[int]:
+        return self._ids.tolist()
+
+    def union(self, other) -> "IdSet":
+        """
+        IDs in either set
+        """
+        other = self._coerce(other)
+        if np is not None:
+            return self._from_numpy(np.union1d(self._numpy(), other._numpy()))
+
+        a, b = self._ids, other._ids
+        result = array("i")
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                result.append(a[i])
+                i += 1
+            elif b[j] < a[i]:
+                result.append(b[j])
+                j += 1
+            else:
+                result.append(a[i])
+                i += 1
+                j += 1
+
+        result.extend(a[i:])
+        result.extend(b[j:])
+        return self._from_sorted(result)
+
+    def intersection(self, other) -> "IdSet":
+        """
+        IDs in both sets. Sets of similar size are merged, otherwise the IDs of the small set are searched in the
+        large one, which only costs a few steps per ID of the small set
+        """
+        other = self._coerce(other)
+        small, large = sorted((self, other), key=len)
+        if len(small) * GALLOP_RATIO < len(large):
+            return small._gallop(large)
+
+        if np is not None:
+            return self._from_numpy(
+                np.intersect1d(self._numpy(), other._numpy(), assume_unique=True)
+            )
+
+        a, b = self._ids, other._ids
+        result = array("i")
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                i += 1
+            elif b[j] < a[i]:
+                j += 1
+            else:
+                result.append(a[i])
+                i += 1
+                j += 1
+
+        return self._from_sorted(result)
+
+    def _gallop(self, large: "IdSet") -> "IdSet":
+        """
+        Intersect with a much larger set by galloping: from where the previous ID was found, step ahead in doubling
+        strides until we pass the next ID, then binary search the last stride
+        """
+        if np is not None:
+            # searchsorted does a binary search per ID, which is just as good here
+            ids, values = self._numpy(), large._numpy()
+            positions = np.searchsorted(values, ids)
+            found = positions < len(values)
+            found[found] = values[positions[found]] == ids[found]
+            return self._from_numpy(ids[found])
+
+        b = large._ids
+        result = array("i")
+        low = 0
+        for record_id in self._ids:
+            step = 1
+            high = low
+            while high < len(b) and b[high] < record_id:
+                low = high
+                high += step
+                step *= 2
+
+            low = bisect_left(b, record_id, low, min(high + 1, len(b)))
+            if low == len(b):
+                break
+
+            if b[low] == record_id:
+                result.append(record_id)
+
+        return self._from_sorted(result)
+
+    def difference(self, other) -> "IdSet":
+        """
+        IDs in this set but not in the other
+        """
+        other = self._coerce(other)
+        if np is not None:
+            return self._from_numpy(
+                np.setdiff1d(self._numpy(), other._numpy(), assume_unique=True)
+            )
+
+        a, b = self._ids, other._ids
+        result = array("i")
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                result.append(a[i])
+                i += 1
+            elif b[j] < a[i]:
+                j += 1
+            else:
+                i += 1
+                j += 1
+
+        result.extend(a[i:])
+        return self._from_sorted(result)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+
+def intersect_all(id_sets: Sequence[IdSet]) -> IdSet:
+    """
+    Intersect any number of sets, smallest first so every step is as cheap as possible
+
+    :param id_sets: The sets to intersect
+    :returns: IDs in all of the sets, an empty set if there are none
+    """
+    if not id_sets:
+        return IdSet()
+
+    id_sets = sorted(id_sets, key=len)
+    result = id_sets[0]
+    for id_set in id_sets[1:]:
+        if not result:
+            break
+
+        result = result & id_set
+
+    return result
+
+
+def parse_object_ids(chunks: Iterable[bytes]) -> array:
+    """
+    Incrementally parse the objectIDs list out of an API response body, straight into a typed array. Only the
+    current chunk is ever held in memory, instead of the whole body and a list of python ints
+
+    :param chunks: Response body chunks, e.g. from response.iter_content()
+    :returns: array('i') of the IDs in the order the API returned them (empty if the API returned null)
+    """
+    ids = array("i")
+    chunks = iter(chunks)
+    buffer = b""
+
+    # Find the key, it might be split between chunks
+    for chunk in chunks:
+        buffer += chunk
+        position = buffer.find(OBJECT_IDS_KEY)
+        if position != -1:
+            buffer = buffer[position + len(OBJECT_IDS_KEY) :]
+            break
+
+        buffer = buffer[-len(OBJECT_IDS_KEY) :]
+    else:
+        return ids
+
+    # Find the start of the list, the API sends null when nothing matched
+    while not buffer.lstrip(b" \t\r\n:"):
+        chunk = next(chunks, None)
+        if chunk is None:
+            return ids
+
+        buffer += chunk
+
+    buffer = buffer.lstrip(b" \t\r\n:")
+    if not buffer.startswith(b"["):
+        return ids
+
+    buffer = buffer[1:]
+
+    # Parse the numbers, the last one in a chunk might continue in the next chunk
+    while True:
+        end = buffer.find(b"]")
+        if end != -1:
+            ids.extend(int(part) for part in buffer[:end].split(b",") if part.strip())
+            return ids
+
+        *complete, buffer = buffer.split(b",")
+        ids.extend(int(part) for part in complete if part.strip())
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError("Response ended in the middle of the objectIDs list")
+
+        buffer += chunk
@@ -0,0 +1,193 @@
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable
+from loguru import logger
+from src.api.shared_files import FileLock, atomic_write
+from src.dir_utils.dirs import get_app_data_dir
+
+# Names of the verified sets, as attributes and in the index file
+VERIFIED_SETS = ("displayable", "not_public_domain", "no_image")
+
+
+class ImageAvailabilityIndex:
+    """
+    Verified image availability of records. Unlike the API's hasImages flag this is based on the actual record
+    data, so a record is only displayable if it really has a public domain image we can show
+    """
+
+    def __init__(self, index_path=None) -> None:
+        if index_path is None:
+            # Default to our data path
+            index_path = get_app_data_dir() / "image_availability.json"
+
+        self.index_path = Path(index_path)
+        # Public domain records with an image url
+        self.displayable = set()
+        # Records that have an image we are not allowed to show
+        self.not_public_domain = set()
+        # Records without any image (or that don't exist anymore)
+        self.no_image = set()
+        self.dirty = False
+        # Goes up with every change, so derived results can be cached until it moves
+        self.version = 0
+        self._lock = threading.Lock()
+        self.load_index()
+
+    def read_index(self) -> Dict[str, set]:
+        """
+        Read the verified sets from disk
+        :returns: Dictionary of the set names and their record IDs, empty if there is no (valid) index
+        """
+        if not self.index_path.exists():
+            return {}
+
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to load image availability index: {e}")
+            return {}
+
+        return {name: set(data.get(name, [])) for name in VERIFIED_SETS}
+
+    def load_index(self):
+        """
+        Load the verified sets from disk, a missing file just means nothing is verified yet
+        """
+        data = self.read_index()
+        if not data:
+            return
+
+        with self._lock:
+            self.displayable = data["displayable"]
+            self.not_public_domain = data["not_public_domain"]
+            self.no_image = data["no_image"]
+            self.version += 1
+
+    def save_index(self):
+        """
+        Save the verified sets if anything changed. Other app instances verify records too, so under a lock the
+        index on disk is merged with ours (our verdict wins for records we both know) and their records are picked
+        up. The file is replaced in one go so readers never see it half written
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+
+            ours = {name: set(getattr(self, name)) for name in VERIFIED_SETS}
+            self.dirty = False
+
+        verified_here = set().union(*ours.values())
+
+        with FileLock(self.index_path.with_name(f"{self.index_path.name}.lock")):
+            on_disk = self.read_index()
+            theirs = {
+                name: on_disk.get(name, set()) - verified_here for name in VERIFIED_SETS
+            }
+
+            data = {"updated_on": datetime.now().isoformat()}
+            for name in VERIFIED_SETS:
+                data[name] = sorted(ours[name] | theirs[name])
+
+            with atomic_write(self.index_path) as f:
+                json.dump(data, f)
+
+        with self._lock:
+            for name, record_ids in theirs.items():
+                new = {r for r in record_ids if not self._is_verified(r)}
+                if new:
+                    getattr(self, name).update(new)
+                    self.version += 1
+
+    def update_from_record(self, record: Dict):
+        """
+        Verify a record from its full data
+
+        :param record: Record data from the API or the record store
+        """
+        record_id = int(record["objectID"])
+
+        if record.get("primaryImageSmall"):
+            target = self.displayable
+        elif not record.get("isPublicDomain"):
+            target = self.not_public_domain
+        else:
+            target = self.no_image
+
+        self._set(record_id, target)
+
+    def mark_missing(self, record_id: int):
+        """
+        The record no longer exists in the database so there is nothing to show
+
+        :param record_id: ID of the record
+        """
+        self._set(int(record_id), self.no_image)
+
+    def _set(self, record_id: int, target: set):
+        """
+        Move a record into one of the verified sets
+        """
+        with self._lock:
+            if record_id in target:
+                return
+
+            for verified in (self.displayable, self.not_public_domain, self.no_image):
+                verified.discard(record_id)
+
+            target.add(record_id)
+            self.dirty = True
+            self.version += 1
+
+    def is_verified(self, record_id: int) -> bool:
+        """
+        Check if we know the image availability of a record
+        """
+        with self._lock:
+            return self._is_verified(record_id)
+
+    def _is_verified(self, record_id: int) -> bool:
+        """
+        is_verified for callers that already hold the lock
+        """
+        return (
+            record_id in self.displayable
+            or record_id in self.not_public_domain
+            or record_id in self.no_image
+        )
+
+    def displayable_in(self, record_ids: set) -> set:
+        """
+        Get the verified displayable records out of the given records
+
+        :param record_ids: Set of record IDs
+        :returns: Set of record IDs that are verified to have a displayable image
+        """
+        with self._lock:
+            return self.displayable & record_ids
+
+    def unverified_in(self, record_ids: Iterable[int]) -> set:
+        """
+        Get the records we don't know the image availability of yet
+
+        :param record_ids: Record IDs to check
+        :returns: Set of unverified record IDs
+        """
+        with self._lock:
+            unverified = set(record_ids) - self.displayable
+            return unverified - self.not_public_domain - self.no_image
+
+    def split_image_records(self, record_ids: set, candidates: set) -> tuple[set, set]:
+        """
+        Split records that might have an image into verified and not yet verified ones. Records the API marks as
+        having images are candidates until they are verified
+
+        :param record_ids: Set of record IDs to filter
+        :param candidates: Set of record IDs the API marks as having images
+        :returns: Verified displayable records and unverified candidates
+        """
+        verified = self.displayable_in(record_ids)
+        unverified = self.unverified_in(candidates & record_ids)
+        return verified, unverified
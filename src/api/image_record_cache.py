@@ -1,8 +1,11 @@
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 import json
 from loguru import logger
+from src.api.id_set import IdSet
 from src.api.met_api import MetAPI
+from src.api.shared_files import atomic_write
 from src.dir_utils.dirs import get_app_data_dir
 
 
@@ -23,15 +26,33 @@ class ImageRecordCache:
         record_ids = self.api.get_all_records_with_images(
             progress_callback=progress_callback
         )
+        self.write_cache(record_ids)
 
+    def write_cache(self, record_ids: IdSet):
+        """
+        Write a set of record IDs as the new cache. It's published in one go, so other instances loading it at the
+        same time get either the old or the new version
+        :param record_ids: IDs of the records with images
+        """
         data = {
             "updated_on": datetime.now().isoformat(),
-            "record_ids": list(record_ids),
+            "record_ids": record_ids.tolist(),
         }
 
-        with open(self.cache_path, "w") as f:
+        with atomic_write(self.cache_path) as f:
             json.dump(data, f, indent=2)
 
+    def updated_on(self) -> Optional[datetime]:
+        """
+        When the cache was last refreshed
+        :returns: Time of the last refresh or None if we can't tell
+        """
+        try:
+            with open(self.cache_path, "r") as f:
+                return datetime.fromisoformat(json.load(f)["updated_on"])
+        except (OSError, KeyError, ValueError):
+            return None
+
     def load_cache(self) -> set:
         """
         Load the cach into the app
@@ -0,0 +1,300 @@
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from loguru import logger
+
+# Default limit for all in memory caches together, can be changed with the METBROWSER_MEMORY_LIMIT_MB variable
+DEFAULT_LIMIT_MB = 256
+# Below this much free system memory we trim the caches
+LOW_MEMORY_BYTES = 256 * 1024 * 1024
+# How much of the limit we keep when the system is low on memory
+PRESSURE_TRIM_RATIO = 0.5
+
+
+class BudgetedCache:
+    """
+    In memory LRU cache that reports its size to a MemoryBudget, which decides what gets evicted
+    """
+
+    def __init__(
+        self,
+        name: str,
+        budget: "MemoryBudget",
+        size_of: Callable[[Any], int],
+        cost: float = 1.0,
+    ) -> None:
+        """
+        :param name: Name shown in the memory usage report
+        :param budget: The budget the cache registers with
+        :param size_of: Function returning the approximate size of a value in bytes
+        :param cost: Relative cost of rebuilding an entry, expensive entries are kept longer
+        """
+        self.name = name
+        self.budget = budget
+        self.size_of = size_of
+        self.cost = cost
+        # key -> (value, size, last_used)
+        self._entries: OrderedDict = OrderedDict()
+        self.size_bytes = 0
+        budget.register(self)
+
+    def get(self, key: Hashable, default=None):
+        """
+        Get a value and mark it as recently used
+
+        :param key: Cache key
+        :param default: Returned when the key is not cached
+        :returns: The cached value
+        """
+        with self.budget.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, size, _ = entry
+            self._entries[key] = (value, size, time.monotonic())
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value, size: Optional[int] = None):
+        """
+        Add a value, this might evict entries of any registered cache
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param size: Size of the value in bytes if the caller already knows it
+        """
+        if size is None:
+            size = self.size_of(value)
+
+        with self.budget.lock:
+            self.discard(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self.size_bytes += size
+
+        self.budget.enforce()
+
+    def discard(self, key: Hashable):
+        """
+        Remove a value if it is cached
+
+        :param key: Cache key
+        """
+        with self.budget.lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= entry[1]
+
+    def clear(self):
+        """
+        Remove everything
+        """
+        with self.budget.lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def oldest(self) -> Optional[tuple]:
+        """
+        Get the least recently used entry, the budget's eviction candidate for this cache
+
+        :returns: Key, size and last used time, or None if the cache is empty
+        """
+        if not self._entries:
+            return None
+
+        key, (_, size, last_used) = next(iter(self._entries.items()))
+        return key, size, last_used
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MemoryBudget:
+    """
+    Global limit for all in memory caches. When the caches together go over the limit, entries are evicted across
+    all of them, the oldest, largest and cheapest to rebuild first
+    """
+
+    def __init__(self, limit_bytes: Optional[int] = None) -> None:
+        if limit_bytes is None:
+            limit_mb = int(os.environ.get("METBROWSER_MEMORY_LIMIT_MB", DEFAULT_LIMIT_MB))
+            limit_bytes = limit_mb * 1024 * 1024
+
+        self.limit_bytes = limit_bytes
+        self.caches: List[BudgetedCache] = []
+        # A single lock for all caches so eviction sees a consistent state
+        self.lock = threading.RLock()
+
+    def register(self, cache: BudgetedCache):
+        """
+        Add a cache to the budget
+
+        :param cache: The cache to manage
+        """
+        with self.lock:
+            self.caches.append(cache)
+
+    @property
+    def used_bytes(self) -> int:
+        """
+        Total size of all caches
+        """
+        return sum(cache.size_bytes for cache in self.caches)
+
+    def usage(self) -> Dict[str, Dict]:
+        """
+        Current usage of every cache
+
+        :returns: Dictionary of cache names with their entry count and size in bytes
+        """
+        with self.lock:
+            return {
+                cache.name: {"entries": len(cache), "bytes": cache.size_bytes}
+                for cache in self.caches
+            }
+
+    def enforce(self, target_bytes: Optional[int] = None):
+        """
+        Evict entries until the caches fit in the budget
+
+        :param target_bytes: Size to shrink to, the limit by default
+        """
+        if target_bytes is None:
+            target_bytes = self.limit_bytes
+
+        with self.lock:
+            used = self.used_bytes
+            evicted = 0
+            now = time.monotonic()
+
+            while used > target_bytes:
+                victim = None
+                best_score = -1.0
+
+                # Only the LRU entry of every cache is a candidate, that keeps eviction cheap
+                for cache in self.caches:
+                    oldest = cache.oldest()
+                    if oldest is None:
+                        continue
+
+                    key, size, last_used = oldest
+                    score = (now - last_used + 1) * size / cache.cost
+                    if score > best_score:
+                        best_score = score
+                        victim = (cache, key, size)
+
+                if victim is None:
+                    break
+
+                cache, key, size = victim
+                cache.discard(key)
+                used -= size
+                evicted += 1
+
+        if evicted:
+            logger.debug(f"Evicted {evicted} cache entries, {used} bytes in use")
+
+    def trim(self, ratio: float):
+        """
+        Shrink the caches to part of the limit, used when the system is low on memory
+
+        :param ratio: Part of the limit to keep
+        """
+        self.enforce(int(self.limit_bytes * ratio))
+
+    def check_memory_pressure(self, available: Optional[int] = None) -> bool:
+        """
+        Trim the caches if the system is running out of memory, see available_system_memory for where that comes
+        from
+
+        :param available: Available system memory in bytes. It's read here when not given, that can mean running
+            vm_stat, so the UI samples it on a worker thread and only passes the result in
+        :returns: True if the caches were trimmed
+        """
+        if available is None:
+            available = available_system_memory()
+
+        if available is None or available >= LOW_MEMORY_BYTES:
+            return False
+
+        logger.warning(f"Low on memory ({available} bytes available), trimming caches")
+        self.trim(PRESSURE_TRIM_RATIO)
+        return True
+
+
+# Set once we logged that the available memory can't be read, so it's only said once
+_unavailable_logged = False
+
+
+def _macos_available_memory() -> Optional[int]:
+    """
+    Read the available memory from vm_stat: free pages plus the inactive and speculative ones the system hands out
+    again as soon as someone needs them
+    """
+    output = subprocess.run(
+        ["vm_stat"], capture_output=True, text=True, timeout=2, check=True
+    ).stdout
+
+    page_size = re.search(r"page size of (\d+) bytes", output)
+    pages = {
+        name: int(count)
+        for name, count in re.findall(r"Pages (\w+):\s+(\d+)\.", output)
+    }
+    if page_size is None or "free" not in pages:
+        return None
+
+    reclaimable = ("free", "inactive", "speculative")
+    return sum(pages.get(name, 0) for name in reclaimable) * int(page_size.group(1))
+
+
+def _linux_available_memory() -> Optional[int]:
+    """
+    Read MemAvailable from /proc/meminfo, MemFree leaves out the page cache that is freed on demand
+    """
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                # The value is in kB
+                return int(line.split()[1]) * 1024
+
+    return None
+
+
+def available_system_memory() -> Optional[int]:
+    """
+    Get the memory the system can hand out right now. Uses psutil when it's installed, otherwise vm_stat on macOS
+    and /proc/meminfo on Linux. If none of them work that's logged once and the memory pressure check is off
+
+    :returns: Available memory in bytes or None if we can't tell
+    """
+    global _unavailable_logged
+
+    available = None
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        if sys.platform == "darwin":
+            available = _macos_available_memory()
+        elif os.path.exists("/proc/meminfo"):
+            available = _linux_available_memory()
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.debug(f"Failed to read the available memory: {e}")
+
+    if available is None and not _unavailable_logged:
+        logger.info("Can't tell how much memory is available, caches are not trimmed")
+        _unavailable_logged = True
+
+    return available
@@ -1,9 +1,46 @@
-from typing import Dict
+import json
+import threading
+import time
+from typing import Dict, Optional
 import requests
 from tqdm import tqdm
 from loguru import logger
+from src.api.id_set import IdSet, parse_object_ids
 
 BASE_URL = "https://collectionapi.metmuseum.org"
+# The API wants about a minute of rest once we hit the rate limit
+RATE_LIMIT_PAUSE = 60
+# First wait before retrying a request that failed for another reason than the rate limit, doubled every attempt
+RETRY_BACKOFF = 1.0
+# (connect, read) timeouts in seconds, so a stalled request can never hang a worker forever
+TIMEOUT = (5, 15)
+# Waiting for the connection and the headers of a record can't be interrupted, so it may take this long at most.
+# Records are small, a healthy server answers well within it
+RECORD_TIMEOUT = (3.05, 5)
+# ID list responses are several megabytes, they are parsed in chunks of this size
+ID_CHUNK_SIZE = 64 * 1024
+# hasImages searches need a query, searching every letter is the closest we get to all records with images
+IMAGE_SEARCH_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+# Status codes the API answers with once we went over the rate limit
+RATE_LIMIT_STATUS_CODES = {403, 429}
+
+
+class RecordNotFoundError(ConnectionError):
+    """
+    The record does not exist in the database, there is no point in asking for it again
+    """
+
+
+class RateLimitedError(ConnectionError):
+    """
+    The API refused the request because we went over the rate limit, all requests should pause for a while
+    """
+
+
+class RequestCancelled(Exception):
+    """
+    The request was aborted by the caller before it finished
+    """
 
 
 class MetAPI:
@@ -15,31 +52,186 @@ class MetAPI:
         self.records_url = "/public/collection/v1/objects"
         self.search_url = "/public/collection/v1/search"
 
-    def get_all_records(self) -> list[int]:
+    def get_object_ids(
+        self,
+        url: str,
+        params: Optional[Dict] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> IdSet:
+        """
+        Fetch an endpoint that returns a list of object IDs. The body is streamed and parsed straight into a typed
+        array, so the full response and a list of python ints never have to be in memory at once
+
+        :param url: Url of the endpoint
+        :param params: Query parameters
+        :param cancel_event: Event that aborts the request between chunks of the body when set
+        :returns: Set of record IDs
+        """
+
+        def chunks(response):
+            for chunk in response.iter_content(chunk_size=ID_CHUNK_SIZE):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(f"Request for {url} cancelled")
+
+                yield chunk
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled(f"Request for {url} cancelled")
+
+        try:
+            with requests.get(
+                url, params=params, timeout=TIMEOUT, stream=True
+            ) as response:
+                if response.status_code in RATE_LIMIT_STATUS_CODES:
+                    raise RateLimitedError(f"Rate limited on {url}")
+
+                if response.status_code != 200:
+                    raise ConnectionError(
+                        f"Failed to fetch {url} ({response.status_code})"
+                    )
+
+                ids = parse_object_ids(chunks(response))
+        except (requests.RequestException, ValueError) as e:
+            raise ConnectionError(f"Failed to fetch {url}: {e}")
+
+        return IdSet.from_array(ids)
+
+    def get_all_records(self) -> IdSet:
         """
         Get all of the record IDs in the database
-        :returns: List of record IDs
+        :returns: Set of record IDs
         """
-        response = requests.get(f"{BASE_URL}{self.records_url}")
-        if response.status_code == 200:
-            return response.json()["objectIDs"]
-        else:
-            logger.error("Failed to fetch all records")
+        try:
+            return self.get_object_ids(f"{BASE_URL}{self.records_url}")
+        except ConnectionError as e:
+            logger.error(f"Failed to fetch all records: {e}")
             raise ConnectionError("Failed to fetch all reccords")
 
-    def get_single_record(self, record_id) -> Dict:
+    def search(
+        self,
+        query: str,
+        has_images: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> IdSet:
+        """
+        Search the database
+
+        :param query: Search term
+        :param has_images: Only return records marked as having images
+        :param cancel_event: Event that aborts the search when set, results can be several megabytes
+        :returns: Set of matching record IDs
+        """
+        params = {"q": query}
+        if has_images:
+            params["hasImages"] = "true"
+
+        return self.get_object_ids(
+            f"{BASE_URL}{self.search_url}", params=params, cancel_event=cancel_event
+        )
+
+    def get_single_record(
+        self, record_id, cancel_event: Optional[threading.Event] = None
+    ) -> Dict:
         """
-        Return all of the data of a single record based on its ID
+        Return all of the data of a single record based on its ID. The cancel event is checked before the request,
+        once the headers are in and between the chunks of the body. Connecting and waiting for the headers can't be
+        interrupted, that's why they have short timeouts
+
+        :param record_id: ID of the record
+        :param cancel_event: Event that aborts the request when set
         :returns: Dictionary with all of the record data
         """
-        response = requests.get(f"{BASE_URL}{self.records_url}/{record_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Failed to fetch record {record_id}")
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+        try:
+            response = requests.get(
+                f"{BASE_URL}{self.records_url}/{record_id}",
+                timeout=RECORD_TIMEOUT,
+                stream=True,
+            )
+        except requests.RequestException as e:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+            logger.error(f"Failed to fetch record {record_id}: {e}")
             raise ConnectionError(f"Failed to fetch record {record_id}")
 
-    def get_all_records_with_images(self, progress_callback=None) -> set[int]:
+        with response:
+            if cancel_event is not None and cancel_event.is_set():
+                # Don't read a body nobody wants anymore
+                raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+            if response.status_code == 200:
+                chunks = []
+                try:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise RequestCancelled(
+                                f"Request for record {record_id} cancelled"
+                            )
+
+                        chunks.append(chunk)
+                except requests.RequestException as e:
+                    logger.error(f"Failed to read record {record_id}: {e}")
+                    raise ConnectionError(f"Failed to fetch record {record_id}")
+
+                return json.loads(b"".join(chunks))
+            elif response.status_code == 404:
+                logger.error(f"Record {record_id} does not exist")
+                raise RecordNotFoundError(f"Record {record_id} does not exist")
+            elif response.status_code in RATE_LIMIT_STATUS_CODES:
+                logger.error(f"Rate limited on record {record_id}")
+                raise RateLimitedError(f"Rate limited on record {record_id}")
+            else:
+                logger.error(f"Failed to fetch record {record_id}")
+                raise ConnectionError(f"Failed to fetch record {record_id}")
+
+    def get_single_record_with_retries(
+        self,
+        record_id,
+        limiter,
+        retries: int = 3,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict:
+        """
+        Fetch a record within the rate limit, backing off and retrying when the API refuses the request. Used by
+        bulk operations that fetch many records from several threads
+
+        :param record_id: ID of the record
+        :param limiter: RateLimiter shared by all threads making requests
+        :param retries: Number of attempts before giving up
+        :param cancel_event: Event that aborts the request when set
+        :returns: Dictionary with all of the record data
+        """
+        for attempt in range(retries):
+            if not limiter.acquire(cancel_event):
+                raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+            try:
+                return self.get_single_record(record_id, cancel_event=cancel_event)
+            except (RecordNotFoundError, RequestCancelled):
+                raise
+            except ConnectionError as e:
+                if attempt == retries - 1:
+                    raise
+
+                if isinstance(e, RateLimitedError):
+                    # The limiter may be shared, so every thread using it pauses
+                    logger.warning(f"Rate limited on {record_id}, pausing")
+                    limiter.pause(RATE_LIMIT_PAUSE)
+                    continue
+
+                backoff = RETRY_BACKOFF * 2**attempt
+                logger.warning(
+                    f"Request for {record_id} failed, retrying in {backoff}s"
+                )
+                if cancel_event is None:
+                    time.sleep(backoff)
+                elif cancel_event.wait(backoff):
+                    raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+    def get_all_records_with_images(self, progress_callback=None) -> IdSet:
         """
         Fetch all of the records that have an image according to the API. This is problematic since it seems to return
         records that are not in the public domain
@@ -47,48 +239,18 @@ class MetAPI:
         :returns: Set of record IDs that are marked as having an image in the database
         """
         logger.info("Fetching all records with images")
-        records = set()
-        abc = [
-            "a",
-            "b",
-            "c",
-            "d",
-            "e",
-            "f",
-            "g",
-            "h",
-            "i",
-            "j",
-            "k",
-            "l",
-            "m",
-            "n",
-            "o",
-            "p",
-            "q",
-            "r",
-            "s",
-            "t",
-            "u",
-            "v",
-            "w",
-            "x",
-            "y",
-            "z",
-        ]
-        for i, letter in enumerate(abc):
+        records = IdSet()
+        for i, letter in enumerate(IMAGE_SEARCH_LETTERS):
             if progress_callback:
-                progress_callback(i + 1, len(abc), f"Searching for letter {letter}")
-            response = requests.get(
-                f"{BASE_URL}/public/collection/v1/search?hasImages=true&q={letter}"
-            )
+                progress_callback(
+                    i + 1, len(IMAGE_SEARCH_LETTERS), f"Searching for letter {letter}"
+                )
+            try:
+                found = self.search(letter, has_images=True)
+            except ConnectionError as e:
+                raise ConnectionError(f"Failed to fetch records for {letter}: {e}")
 
-            if response.status_code == 200:
-                found = response.json().get("objectIDs")
-                records.update(found)
-
-                logger.info(f"Collected {len(list(records))} records")
-            else:
-                raise ConnectionError(f"Failed to fetch records for {letter}")
+            records = records | found
+            logger.info(f"Collected {len(records)} records")
 
         return records
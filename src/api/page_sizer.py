@@ -0,0 +1,116 @@
+import math
+import threading
+import time
+from typing import Optional
+from src.api.rate_limiter import RateLimiter
+
+# Never fetch fewer or more records than this in one page
+MIN_PAGE_SIZE = 4
+MAX_PAGE_SIZE = 200
+# Weight of the newest sample in the moving averages
+SMOOTHING = 0.3
+# Seconds per record we assume until we have measured it
+DEFAULT_LATENCY = 0.3
+# A page should take about this long to fetch, so pages grow on fast links and shrink on slow ones
+TARGET_PAGE_SECONDS = 2.0
+# The scroll speed decays to zero once the user stops scrolling for this long
+SCROLL_IDLE_SECONDS = 1.0
+
+
+class PageSizer:
+    """
+    Decide how many records to fetch per page. The first page is just what fits on screen, so it arrives as early as
+    possible. Later pages cover what the user will scroll past while they load, grow when records arrive quickly
+    and stay within the remaining rate limit budget, so nothing is fetched the user never scrolls to
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None) -> None:
+        """
+        :param limiter: The app wide rate limiter, its remaining budget caps the page size
+        """
+        self.limiter = limiter
+        # Moving average of the seconds a record takes to fetch from the API
+        self.latency = None
+        # Moving average of the rows per second the user scrolls
+        self._scroll_speed = 0.0
+        self._last_scroll = None
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds: float):
+        """
+        Measure a record fetched from the API, thread safe so fetchers can call it directly
+
+        :param seconds: Time the request took
+        """
+        with self._lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += SMOOTHING * (seconds - self.latency)
+
+    def record_scroll(self, position: float):
+        """
+        Measure the scroll speed
+
+        :param position: Scroll position in rows
+        """
+        now = time.monotonic()
+        if self._last_scroll is not None:
+            last_time, last_position = self._last_scroll
+            elapsed = now - last_time
+            if 0 < elapsed < SCROLL_IDLE_SECONDS:
+                speed = abs(position - last_position) / elapsed
+                self._scroll_speed += SMOOTHING * (speed - self._scroll_speed)
+            else:
+                self._scroll_speed = 0.0
+
+        self._last_scroll = (now, position)
+
+    @property
+    def scroll_speed(self) -> float:
+        """
+        Rows per second the user is scrolling at, zero when they stopped
+        """
+        if self._last_scroll is None:
+            return 0.0
+
+        if time.monotonic() - self._last_scroll[0] > SCROLL_IDLE_SECONDS:
+            return 0.0
+
+        return self._scroll_speed
+
+    def first_page(self, visible_rows: int) -> int:
+        """
+        Size of the first page of a new selection
+
+        :param visible_rows: Number of rows that fit in the results list
+        :returns: Number of records to fetch
+        """
+        # One more for the row that is partly visible
+        return self._clamp(visible_rows + 1)
+
+    def next_page(self, visible_rows: int) -> int:
+        """
+        Size of the next page, when the user scrolls towards the end of what is loaded
+
+        :param visible_rows: Number of rows that fit in the results list
+        :returns: Number of records to fetch
+        """
+        with self._lock:
+            latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+
+        # What the user scrolls past while the page loads, at least a screen
+        wanted = visible_rows + self.scroll_speed * TARGET_PAGE_SECONDS
+        # What the link delivers in the time a page should take
+        deliverable = TARGET_PAGE_SECONDS / max(latency, 0.001)
+        size = max(wanted, min(deliverable, visible_rows * 4))
+
+        if self.limiter is not None:
+            # Don't go into debt with the rate limit, but always fetch a screen
+            size = min(size, max(self.limiter.remaining, visible_rows))
+
+        return self._clamp(math.ceil(size))
+
+    @staticmethod
+    def _clamp(size: int) -> int:
+        return min(max(size, MIN_PAGE_SIZE), MAX_PAGE_SIZE)
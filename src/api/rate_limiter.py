@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket to keep concurrent requests within the API rate limit. A limiter can have a parent,
+    then a request needs a token from both: e.g. a slow limiter for a background thread whose requests still count
+    against the app wide limit
+    """
+
+    def __init__(
+        self,
+        rate: float = 80,
+        burst: Optional[int] = None,
+        parent: Optional["RateLimiter"] = None,
+    ) -> None:
+        """
+        :param rate: Requests allowed per second
+        :param burst: Maximum number of requests that can be made at once, defaults to the rate
+        :param parent: Limiter every request also has to pass
+        """
+        self.rate = rate
+        self.parent = parent
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """
+        Add the tokens that accumulated since the last update
+        """
+        elapsed = now - self._updated
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self, cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        Block until a request is allowed
+
+        :param cancel_event: Event that stops the wait when set, a pause can otherwise keep us waiting for a minute
+        :returns: True if the request may be made, False if the wait was cancelled
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+
+                    wait = (1 - self._tokens) / self.rate
+
+            if cancel_event is None:
+                time.sleep(wait)
+            elif cancel_event.wait(wait):
+                return False
+
+        if self.parent is not None:
+            return self.parent.acquire(cancel_event)
+
+        return True
+
+    def pause(self, seconds: float):
+        """
+        Stop all requests for a while, used when the API tells us we went over the limit
+
+        :param seconds: How long to pause for
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+        # The API limit is for all of our requests
+        if self.parent is not None:
+            self.parent.pause(seconds)
+
+    @property
+    def remaining(self) -> float:
+        """
+        Number of requests that can be made right now without waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return 0.0
+
+            self._refill(now)
+            return self._tokens
@@ -0,0 +1,298 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from src.api.met_api import RequestCancelled
+from src.api.shared_files import striped_lock
+from src.dir_utils.dirs import get_app_data_dir
+
+# The database is vacuumed when more than this part of it is free pages
+FREE_PAGES_RATIO = 0.1
+# How long we wait for another writer, in milliseconds (sqlite's busy timeout)
+BUSY_TIMEOUT_MS = 30000
+# VACUUM only waits this long for the database, it's retried later when someone else is using it
+VACUUM_BUSY_TIMEOUT_MS = 1000
+
+
+class RecordStore:
+    """
+    Local store of full record data as returned by the API, so records only have to be fetched once. Several app
+    instances can share the store: the database runs in WAL mode, so readers work on a snapshot while another
+    process writes, and writers wait for each other instead of failing
+    """
+
+    def __init__(self, db_path=None, memory_cache=None) -> None:
+        """
+        :param db_path: Path of the sqlite database
+        :param memory_cache: Optional BudgetedCache that keeps recently used records in memory
+        """
+        if db_path is None:
+            # Default to our data path
+            db_path = get_app_data_dir() / "records.sqlite3"
+
+        self.db_path = Path(db_path)
+        # sqlite connections can't be shared between threads, so every thread gets its own
+        self._local = threading.local()
+        self.memory_cache = memory_cache
+        self._create_table()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get the sqlite connection of the current thread
+        :returns: An open connection to the store
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.db_path, timeout=BUSY_TIMEOUT_MS / 1000
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Safe in WAL mode, a power cut can only lose the last transactions
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+
+        return connection
+
+    def _create_table(self):
+        """
+        Make sure the records table exists
+        """
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    object_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_on TEXT NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS records_updated_on ON records (updated_on)"
+            )
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """
+        Get a single record from the store
+        :param record_id: ID of the record
+        :returns: Record data or None if we don't have it
+        """
+        if self.memory_cache is not None:
+            record = self.memory_cache.get(int(record_id))
+            if record is not None:
+                return record
+
+        row = (
+            self._connection()
+            .execute("SELECT data FROM records WHERE object_id = ?", (int(record_id),))
+            .fetchone()
+        )
+
+        if row is None:
+            return None
+
+        record = json.loads(row[0])
+        self.remember(record, len(row[0]))
+        return record
+
+    def get_or_fetch(
+        self,
+        record_id: int,
+        fetch: Callable[[], Dict],
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict:
+        """
+        Get a record from the store, or fetch and store it. The fetch runs without holding the record's lock, it may
+        wait for the rate limit, pause or retry and nobody else should wait on that. The lock is only held to check
+        the store again and save, if another thread or app instance stored the record in the meantime we return
+        theirs, so everyone ends up with the same record
+
+        :param record_id: ID of the record
+        :param fetch: Function that fetches the record from the API
+        :param cancel_event: Event that stops waiting for the lock when set
+        :returns: Record data
+        """
+        record = self.get(record_id)
+        if record is not None:
+            return record
+
+        record = fetch()
+
+        lock = striped_lock(self.db_path.parent, f"record-{record_id}")
+        if not lock.acquire(cancel_event):
+            raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+        try:
+            # It might have been stored while we fetched it
+            stored = self.get(record_id)
+            if stored is not None:
+                return stored
+
+            self.put(record)
+        finally:
+            lock.release()
+
+        return record
+
+    def remember(self, record: Dict, size: int):
+        """
+        Keep a record in memory, if we have a memory cache
+
+        :param record: Record data
+        :param size: Approximate size of the record (its json length)
+        """
+        if self.memory_cache is not None:
+            self.memory_cache.put(int(record["objectID"]), record, size=size)
+
+    def get_many(self, record_ids: Iterable[int]) -> Dict[int, Dict]:
+        """
+        Get multiple records from the store
+        :param record_ids: IDs of the records
+        :returns: Dictionary of record IDs and data for the records we have
+        """
+        records = {}
+        missing = []
+        for record_id in record_ids:
+            record_id = int(record_id)
+            record = None
+            if self.memory_cache is not None:
+                record = self.memory_cache.get(record_id)
+
+            if record is None:
+                missing.append(record_id)
+            else:
+                records[record_id] = record
+
+        record_ids = missing
+        connection = self._connection()
+
+        # sqlite limits the number of variables in a single query
+        for start in range(0, len(record_ids), 500):
+            chunk = record_ids[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT object_id, data FROM records WHERE object_id IN ({placeholders})",
+                chunk,
+            )
+            for object_id, data in rows:
+                records[object_id] = json.loads(data)
+                self.remember(records[object_id], len(data))
+
+        return records
+
+    def put(self, record: Dict):
+        """
+        Add or replace a single record
+        :param record: Record data from the API
+        """
+        self.put_many([record])
+
+    def put_many(self, records: Iterable[Dict]):
+        """
+        Add or replace multiple records in a single transaction
+        :param records: Records data from the API
+        """
+        updated_on = datetime.now().isoformat()
+        rows = []
+        for record in records:
+            data = json.dumps(record)
+            rows.append((int(record["objectID"]), data, updated_on))
+            self.remember(record, len(data))
+
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO records (object_id, data, updated_on) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def delete(self, record_id: int):
+        """
+        Remove a record, used when it no longer exists in the database
+        :param record_id: ID of the record
+        """
+        if self.memory_cache is not None:
+            self.memory_cache.discard(int(record_id))
+
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM records WHERE object_id = ?", (int(record_id),)
+            )
+
+    def stale_ids(self, updated_before: datetime, limit: int = 100) -> List[int]:
+        """
+        Get the records that were stored the longest ago
+        :param updated_before: Only records stored before this time are returned
+        :param limit: Maximum number of records
+        :returns: List of record IDs, oldest first
+        """
+        rows = self._connection().execute(
+            "SELECT object_id FROM records WHERE updated_on < ? ORDER BY updated_on LIMIT ?",
+            (updated_before.isoformat(), limit),
+        )
+        return [row[0] for row in rows]
+
+    def compact(self) -> bool:
+        """
+        Give free pages back to the file system once a good part of the database is unused (replaced records leave
+        gaps behind) and refresh the query planner's statistics. VACUUM needs the database to itself, when another
+        thread or app instance is using it we give up quickly instead of waiting for it
+
+        :returns: False if the database was busy and compacting should be tried again later
+        """
+        connection = self._connection()
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = connection.execute("PRAGMA page_count").fetchone()[0]
+
+        if total_pages and free_pages / total_pages > FREE_PAGES_RATIO:
+            connection.execute(f"PRAGMA busy_timeout = {VACUUM_BUSY_TIMEOUT_MS}")
+            try:
+                connection.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+
+                return False
+            finally:
+                connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+
+        connection.execute("PRAGMA optimize")
+        return True
+
+    def existing_ids(self, record_ids: Iterable[int]) -> set[int]:
+        """
+        Check which of the given records are already in the store
+        :param record_ids: Record IDs to check
+        :returns: Set of the record IDs that are stored
+        """
+        record_ids = [int(r) for r in record_ids]
+        existing = set()
+        connection = self._connection()
+
+        # sqlite limits the number of variables in a single query
+        for start in range(0, len(record_ids), 500):
+            chunk = record_ids[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT object_id FROM records WHERE object_id IN ({placeholders})",
+                chunk,
+            )
+            existing.update(row[0] for row in rows)
+
+        return existing
+
+    def count(self) -> int:
+        """
+        Number of records in the store
+        :returns: Record count
+        """
+        return self._connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def all_ids(self) -> List[int]:
+        """
+        Get the IDs of all stored records
+        :returns: List of record IDs
+        """
+        rows = self._connection().execute("SELECT object_id FROM records ORDER BY object_id")
+        return [row[0] for row in rows]
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+from loguru import logger
+from src.api.shared_files import atomic_write
+from src.dir_utils.dirs import get_app_data_dir
+
+
+class SessionStore:
+    """
+    Persist the state of the UI between launches, so the app can open where the user left it
+    """
+
+    def __init__(self, session_path=None) -> None:
+        if session_path is None:
+            # Default to our data path
+            session_path = get_app_data_dir() / "session.json"
+
+        self.session_path = Path(session_path)
+
+    def load_session(self) -> Dict:
+        """
+        Load the last saved session
+        :returns: Dictionary of the session state, empty if there is no (valid) session
+        """
+        if not self.session_path.exists():
+            return {}
+
+        try:
+            with open(self.session_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to load session: {e}")
+            return {}
+
+    def save_session(self, state: Dict):
+        """
+        Save the session state, the file is replaced in one go so a crash (or another instance reading it) never
+        sees it half written
+
+        :param state: Dictionary of the session state
+        """
+        data = {"saved_on": datetime.now().isoformat(), **state}
+
+        with atomic_write(self.session_path) as f:
+            json.dump(data, f, indent=2)
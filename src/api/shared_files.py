@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    # Only available on Windows
+    msvcrt = None
+
+# How often a lock that is held by someone else is tried again, in seconds
+LOCK_POLL_INTERVAL = 0.05
+
+
+def temporary_path(path) -> Path:
+    """
+    Name to write a file under before it's moved into place. It's unique per process and thread, so concurrent
+    writers never write to the same temporary file
+
+    :param path: Final path of the file
+    :returns: Path next to it, on the same file system so the move is atomic
+    """
+    path = Path(path)
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+@contextmanager
+def atomic_write(path, mode: str = "w", **kwargs):
+    """
+    Write a file under a temporary name and move it into place once it's complete. Readers in any process see
+    either the old or the new version, never a half written file, and a crash never corrupts it
+
+    :param path: Final path of the file
+    :param mode: File mode, "w" or "wb"
+    :param kwargs: Passed on to open()
+    """
+    path = Path(path)
+    tmp_path = temporary_path(path)
+
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class FileLock:
+    """
+    Exclusive lock shared by all processes using the same data folder, held on a lock file. Every acquire opens
+    the file again, so it also works between threads of the same process
+    """
+
+    def __init__(self, path) -> None:
+        """
+        :param path: Path of the lock file, it's created if needed
+        """
+        self.path = Path(path)
+        self._file = None
+
+    def _try_lock(self) -> bool:
+        """
+        Try to take the lock without blocking
+        :returns: True if we hold the lock now
+        """
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+
+        return True
+
+    def acquire(self, cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        Wait for the lock
+
+        :param cancel_event: Event that stops the wait when set
+        :returns: True if we hold the lock, False if the wait was cancelled
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+b")
+
+        while not self._try_lock():
+            if cancel_event is None:
+                time.sleep(LOCK_POLL_INTERVAL)
+            elif cancel_event.wait(LOCK_POLL_INTERVAL):
+                self._file.close()
+                self._file = None
+                return False
+
+        return True
+
+    def release(self):
+        """
+        Release the lock, other processes waiting for it can continue
+        """
+        if self._file is None:
+            return
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def striped_lock(directory, key) -> FileLock:
+    """
+    Get the lock for a key, like a record or an image. Keys share 256 lock files, so there is a bounded number of
+    them and unrelated keys rarely wait for each other
+
+    :param directory: Folder the lock files live in (in a locks subfolder)
+    :param key: Anything that identifies what is being locked
+    :returns: The lock, not acquired yet
+    """
+    stripe = hashlib.sha1(str(key).encode("utf-8")).hexdigest()[:2]
+    return FileLock(Path(directory) / "locks" / f"{stripe}.lock")
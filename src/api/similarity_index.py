@@ -0,0 +1,90 @@
+import struct
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional
+from loguru import logger
+from src.api.shared_files import atomic_write
+from src.dir_utils.dirs import get_app_data_dir
+
+MAGIC = b"MSIM"
+VERSION = 1
+# magic, version, number of records, neighbours per record
+HEADER = struct.Struct("<4sIII")
+
+
+def write_similarity_index(path, record_ids: array, neighbors: array, k: int):
+    """
+    Write the nearest neighbour table in a compact binary format that loads without any parsing
+
+    :param path: Output file
+    :param record_ids: Sorted array('i') of record IDs
+    :param neighbors: array('i') with k neighbours per record, in the same order as record_ids (0 pads short rows)
+    :param k: Neighbours per record
+    """
+    if len(neighbors) != len(record_ids) * k:
+        raise ValueError("Expected exactly k neighbours per record")
+
+    with atomic_write(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(record_ids), k))
+        record_ids.tofile(f)
+        neighbors.tofile(f)
+
+
+class SimilarityIndex:
+    """
+    Precomputed "more like this" table, built from the open access CSV by utils/classifications_builder.py
+    """
+
+    def __init__(self, index_path=None) -> None:
+        if index_path is None:
+            # Default to our index path
+            index_path = get_app_data_dir() / "similarity_index.bin"
+
+        self.index_path = Path(index_path)
+        self.k = 0
+        self.record_ids = array("i")
+        self.neighbors = array("i")
+        self.load_index()
+
+    @property
+    def available(self) -> bool:
+        """
+        False if the index has not been built
+        """
+        return len(self.record_ids) > 0
+
+    def load_index(self):
+        """
+        Load the table, a missing index just disables the feature
+        """
+        if not self.index_path.exists():
+            logger.info("No similarity index found, more like this is disabled")
+            return
+
+        with open(self.index_path, "rb") as f:
+            magic, version, count, k = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                logger.error(f"Unsupported similarity index {self.index_path}")
+                return
+
+            self.k = k
+            self.record_ids.fromfile(f, count)
+            self.neighbors.fromfile(f, count * k)
+
+    def get_similar(self, record_id: int, k: Optional[int] = None) -> List[int]:
+        """
+        Get the records most similar to a record
+
+        :param record_id: ID of the record
+        :param k: Maximum number of records to return, all precomputed neighbours by default
+        :returns: List of record IDs, most similar first
+        """
+        record_id = int(record_id)
+        row = bisect_left(self.record_ids, record_id)
+        if row >= len(self.record_ids) or self.record_ids[row] != record_id:
+            return []
+
+        k = self.k if k is None else min(k, self.k)
+        start = row * self.k
+        return [r for r in self.neighbors[start : start + k] if r]
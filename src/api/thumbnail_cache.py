@@ -0,0 +1,394 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+from PySide6 import QtCore, QtGui
+from loguru import logger
+import requests
+from src.api.met_api import RequestCancelled
+from src.api.shared_files import striped_lock, temporary_path
+from src.dir_utils.dirs import get_app_data_dir
+
+# Size of the thumbnails in the results list, in logical pixels
+THUMBNAIL_SIZE = 200
+# Full size images are streamed in chunks of this size
+CHUNK_SIZE = 64 * 1024
+# Disk space the caches may use before the least recently used files are evicted
+THUMBNAILS_DISK_LIMIT = 1024 * 1024 * 1024
+ORIGINALS_DISK_LIMIT = 2 * 1024 * 1024 * 1024
+# Partial downloads older than this were left behind by a crash
+STALE_PART_AGE = 60 * 60
+
+
+def touch(path: Path):
+    """
+    Mark a cached file as used, eviction goes by modification time since access times are often not updated
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_directory(directory: Path, max_bytes: int) -> int:
+    """
+    Delete the least recently used files of a cache folder until it fits in its disk budget. Partial downloads
+    and temporary files nobody is writing to anymore are deleted as well
+
+    :param directory: Cache folder
+    :param max_bytes: Disk space the folder may use
+    :returns: Number of deleted files
+    """
+    files = []
+    total = 0
+    deleted = 0
+    now = time.time()
+
+    for path in directory.rglob("*"):
+        try:
+            stat = path.stat()
+        except OSError:
+            # Deleted while we were looking
+            continue
+
+        if not path.is_file():
+            continue
+
+        if path.suffix == ".lock":
+            # Lock files are tiny and might be held by another instance
+            continue
+
+        if path.suffix in (".part", ".tmp"):
+            if now - stat.st_mtime > STALE_PART_AGE:
+                path.unlink(missing_ok=True)
+                deleted += 1
+            continue
+
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+
+        path.unlink(missing_ok=True)
+        total -= size
+        deleted += 1
+
+    return deleted
+
+
+def decode_scaled(data: bytes, width: int, height: int) -> QtGui.QImage:
+    """
+    Decode image data directly at (or close to) the requested size. For JPEGs Qt uses the decoder's DCT scaling
+    so we never have to allocate and decode the full resolution image just to throw most of it away
+
+    :param data: Raw image file data
+    :param width: Target width in device pixels
+    :param height: Target height in device pixels
+    :returns: Decoded image, which is null if the data could not be decoded
+    """
+    buffer = QtCore.QBuffer()
+    buffer.setData(QtCore.QByteArray(data))
+    buffer.open(QtCore.QIODevice.ReadOnly)
+
+    reader = QtGui.QImageReader(buffer)
+    reader.setAutoTransform(True)
+
+    source_size = reader.size()
+    if source_size.isValid() and (
+        source_size.width() > width or source_size.height() > height
+    ):
+        # Only ever scale down, small images are left as they are
+        reader.setScaledSize(
+            source_size.scaled(width, height, QtCore.Qt.KeepAspectRatio)
+        )
+
+    image = reader.read()
+    buffer.close()
+    return image
+
+
+class ThumbnailCache:
+    """
+    Disk cache of downscaled thumbnails, so an image is only downloaded and decoded at full size once. Full size
+    originals streamed for the detail view are kept next to them
+    """
+
+    def __init__(self, cache_dir=None, originals_dir=None, memory_cache=None) -> None:
+        """
+        :param cache_dir: Folder for thumbnails
+        :param originals_dir: Folder for full size images
+        :param memory_cache: Optional BudgetedCache that keeps recently used thumbnails in memory
+        """
+        if cache_dir is None:
+            # Default to our data path
+            cache_dir = get_app_data_dir() / "thumbnails"
+
+        if originals_dir is None:
+            originals_dir = get_app_data_dir() / "originals"
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.originals_dir = Path(originals_dir)
+        self.originals_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_cache = memory_cache
+
+    def thumbnail_path(self, image_url: str, width: int, height: int) -> Path:
+        """
+        Get the on disk location of a thumbnail. The size is part of the key so different screens (DPR) don't clash
+
+        :param image_url: Url of the original image
+        :param width: Thumbnail width in device pixels
+        :param height: Thumbnail height in device pixels
+        :returns: Path of the cached thumbnail (it might not exist yet)
+        """
+        key = hashlib.sha1(f"{image_url}|{width}x{height}".encode("utf-8")).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.jpg"
+
+    def cached(
+        self, image_url: str, width: int, height: int
+    ) -> Optional[QtGui.QImage]:
+        """
+        Get a thumbnail from memory only, this is cheap enough to call from the UI thread
+
+        :param image_url: Url of the original image
+        :param width: Thumbnail width in device pixels
+        :param height: Thumbnail height in device pixels
+        :returns: The image or None if it's not in memory
+        """
+        if self.memory_cache is None:
+            return None
+
+        image = self.memory_cache.get((image_url, width, height))
+        if image is None:
+            return None
+
+        # Callers may change the image (e.g. its pixel ratio), so they get their own (implicitly shared) copy
+        return QtGui.QImage(image)
+
+    def remember(self, image_url: str, width: int, height: int, image: QtGui.QImage):
+        """
+        Keep a thumbnail in memory, if we have a memory cache
+        """
+        if self.memory_cache is not None:
+            self.memory_cache.put((image_url, width, height), QtGui.QImage(image))
+
+    def load(self, image_url: str, width: int, height: int) -> Optional[QtGui.QImage]:
+        """
+        Load a thumbnail from the cache
+
+        :param image_url: Url of the original image
+        :param width: Thumbnail width in device pixels
+        :param height: Thumbnail height in device pixels
+        :returns: The cached image or None if it's not cached
+        """
+        image = self.cached(image_url, width, height)
+        if image is not None:
+            return image
+
+        path = self.thumbnail_path(image_url, width, height)
+        if not path.exists():
+            return None
+
+        image = QtGui.QImage(str(path))
+        if image.isNull():
+            logger.warning(f"Corrupt thumbnail {path}, ignoring it")
+            return None
+
+        touch(path)
+
+        self.remember(image_url, width, height, image)
+        return image
+
+    def save(self, image_url: str, width: int, height: int, image: QtGui.QImage):
+        """
+        Save a thumbnail to the cache
+
+        :param image_url: Url of the original image
+        :param width: Thumbnail width in device pixels
+        :param height: Thumbnail height in device pixels
+        :param image: The downscaled image
+        """
+        path = self.thumbnail_path(image_url, width, height)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Publish it in one go, other instances might be loading it
+        tmp_path = temporary_path(path)
+        try:
+            if image.save(str(tmp_path), "JPG", 90):
+                os.replace(tmp_path, path)
+            else:
+                logger.warning(f"Failed to save thumbnail {path}")
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def fetch(
+        self,
+        image_url: str,
+        width: int,
+        height: int,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> QtGui.QImage:
+        """
+        Get a thumbnail from the cache, or download, decode and cache it. The download happens without holding any
+        lock, thumbnails sharing a lock stripe never wait on each other's network. The lock only covers checking if
+        another thread or app instance saved it first and saving it. This blocks, so it should only be called from
+        a worker thread
+
+        :param image_url: Url of the original image
+        :param width: Thumbnail width in device pixels
+        :param height: Thumbnail height in device pixels
+        :param cancel_event: Event that aborts the download and the wait for the lock when set
+        :returns: The thumbnail, which is null if the download could not be decoded
+        """
+        image = self.load(image_url, width, height)
+        if image is not None:
+            return image
+
+        data = self._read_original(image_url, cancel_event)
+        image = decode_scaled(data, width, height)
+        if image.isNull():
+            return image
+
+        path = self.thumbnail_path(image_url, width, height)
+        lock = striped_lock(self.cache_dir, path.name)
+        if not lock.acquire(cancel_event):
+            raise RequestCancelled(f"Thumbnail of {image_url} cancelled")
+
+        try:
+            # Someone else might have been quicker, then theirs is kept
+            existing = self.load(image_url, width, height)
+            if existing is not None:
+                return existing
+
+            self.save(image_url, width, height, image)
+        finally:
+            lock.release()
+
+        self.remember(image_url, width, height, image)
+        return image
+
+    def _read_original(
+        self, image_url: str, cancel_event: Optional[threading.Event] = None
+    ) -> bytes:
+        """
+        Get the data of an image to make a thumbnail of, from the full image we already have or the network
+        """
+        original_path = self.original_path(image_url)
+        if original_path.exists():
+            # The detail view already streamed the full image, no need to download it again
+            return original_path.read_bytes()
+
+        chunks = []
+        with requests.get(image_url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(f"Download of {image_url} cancelled")
+
+                chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    def evict_disk(
+        self,
+        thumbnails_bytes: int = THUMBNAILS_DISK_LIMIT,
+        originals_bytes: int = ORIGINALS_DISK_LIMIT,
+    ) -> int:
+        """
+        Keep the thumbnails and full size images within their disk budgets. This walks the whole cache, so it
+        should only be called from a worker thread
+
+        :param thumbnails_bytes: Disk space for thumbnails
+        :param originals_bytes: Disk space for full size images
+        :returns: Number of deleted files
+        """
+        deleted = evict_directory(self.cache_dir, thumbnails_bytes)
+        deleted += evict_directory(self.originals_dir, originals_bytes)
+        return deleted
+
+    def original_path(self, image_url: str) -> Path:
+        """
+        Get the on disk location of a full size image
+
+        :param image_url: Url of the image
+        :returns: Path of the cached image (it might not exist yet)
+        """
+        key = hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+        suffix = Path(image_url.split("?")[0]).suffix.lower() or ".jpg"
+        return self.originals_dir / key[:2] / f"{key}{suffix}"
+
+    def download_original(
+        self,
+        image_url: str,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Path:
+        """
+        Stream a full size image to the cache in chunks, these are often many megabytes. The file only appears
+        under its final name once it is complete. The download holds no lock, images sharing a lock stripe never
+        wait on each other's network, the lock only covers moving the file into place. This blocks, so it should
+        only be called from a worker thread
+
+        :param image_url: Url of the image
+        :param progress_callback: Called with the bytes received so far and the total size (0 if unknown)
+        :param cancel_event: Event that aborts the download and the wait for the lock when set
+        :returns: Path of the cached image
+        """
+        path = self.original_path(image_url)
+        if path.exists():
+            touch(path)
+            return path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = temporary_path(path)
+
+        try:
+            self._download_original(
+                image_url, tmp_path, progress_callback, cancel_event
+            )
+
+            lock = striped_lock(self.originals_dir, path.name)
+            if not lock.acquire(cancel_event):
+                raise RequestCancelled(f"Download of {image_url} cancelled")
+
+            try:
+                # Someone else might have been quicker, then theirs is kept
+                if not path.exists():
+                    os.replace(tmp_path, path)
+            finally:
+                lock.release()
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        return path
+
+    def _download_original(
+        self,
+        image_url: str,
+        tmp_path: Path,
+        progress_callback: Optional[Callable[[int, int], None]],
+        cancel_event: Optional[threading.Event],
+    ):
+        """
+        Stream a full size image to a temporary file, see download_original
+        """
+        with requests.get(image_url, timeout=(5, 30), stream=True) as response:
+            response.raise_for_status()
+            total = int(response.headers.get("Content-Length", 0))
+            received = 0
+
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RequestCancelled(f"Download of {image_url} cancelled")
+
+                    f.write(chunk)
+                    received += len(chunk)
+
+                    if progress_callback:
+                        progress_callback(received, total)
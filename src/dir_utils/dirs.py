@@ -14,12 +14,26 @@ def get_app_data_dir():
 
         # Copy over the files
         bundle_data = Path(sys._MEIPASS) / "data"
-        for f in ["classification_index.json", "image_cache.json"]:
+        for f in [
+            "classification_index.json",
+            "image_cache.json",
+            "similarity_index.bin",
+            "date_index.json",
+            "facet_index.bin",
+        ]:
             dest = app_support / f
             if not dest.exists() and (bundle_data / f).exists():
+                import os
                 import shutil
+                from src.api.shared_files import temporary_path
 
-                shutil.copy2(bundle_data / f, dest)
+                # Another instance might be starting at the same time, it should never see a half copied file
+                tmp_path = temporary_path(dest)
+                try:
+                    shutil.copy2(bundle_data / f, tmp_path)
+                    os.replace(tmp_path, dest)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
         return app_support
     else:
         return Path(__file__).parent.parent.parent / "data"
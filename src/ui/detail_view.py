@@ -0,0 +1,499 @@
+import bisect
+import html
+import threading
+from typing import Dict, Optional
+from PySide6 import QtGui, QtWidgets, QtCore
+from src.api.thumbnail_cache import THUMBNAIL_SIZE, ThumbnailCache
+from src.ui.widgets import Image
+from src.ui.worker import ImagePrefetcher, ImageStreamer
+
+
+class ThumbnailButton(Image):
+    """
+    Small clickable image used to switch between the images of a record
+    """
+
+    clicked = QtCore.Signal(int)
+
+    def __init__(self, index: int, thumbnail_cache: ThumbnailCache, parent=None):
+        super().__init__(
+            size=(72, 72),
+            public_domain=True,
+            thumbnail_cache=thumbnail_cache,
+            parent=parent,
+        )
+        self.index = index
+        self.setCursor(QtCore.Qt.PointingHandCursor)
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent):
+        if event.button() == QtCore.Qt.LeftButton:
+            self.clicked.emit(self.index)
+
+        super().mousePressEvent(event)
+
+
+class DetailView(QtWidgets.QWidget):
+    """
+    Detail pane for the selected record. The cached thumbnail is shown instantly, then the full size image is
+    streamed in the background and shown at the pane's size. It's only decoded at full resolution while Actual Size
+    is checked. Additional images are prefetched while the user looks at the first one
+    """
+
+    # A record in the more like this list was clicked
+    similar_selected = QtCore.Signal(dict)
+
+    def __init__(
+        self,
+        thumbnail_cache: ThumbnailCache,
+        parent: Optional[QtWidgets.QWidget] = None,
+    ):
+        """
+        Initialize the widget
+
+        :param thumbnail_cache: Shared image cache, also used by the results list
+        :param parent: Parent widget
+        """
+        super().__init__(parent=parent)
+        self.thumbnail_cache = thumbnail_cache
+        self.record = None
+        self.image_urls = []
+        self.image_url = None
+        self.thumbnail_buttons = {}
+        # Every image we stream gets a new generation, images tagged with an older one are stale
+        self.generation = 0
+        self.streamer = None
+        self.abandoned_streamers = set()
+        self.fit_pixmap = None
+        self.full_pixmap = None
+        # Rank of every similar record, so they are listed most similar first whatever order they arrive in
+        self.similar_ranks = {}
+        self.similar_keys = []
+
+        self.prefetch_pool = QtCore.QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(2)
+        self.prefetch_cancel = threading.Event()
+
+        self.setup_ui()
+        self.clear()
+
+    def setup_ui(self):
+        main_layout = QtWidgets.QVBoxLayout()
+        main_layout.setContentsMargins(0, 0, 0, 0)
+        main_layout.setSpacing(8)
+        self.setLayout(main_layout)
+
+        details_label = QtWidgets.QLabel("Details")
+        details_font = details_label.font()
+        details_font.setBold(True)
+        details_font.setPointSize(13)
+        details_label.setFont(details_font)
+        main_layout.addWidget(details_label)
+
+        # Image
+        self.image_label = QtWidgets.QLabel()
+        self.image_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.image_label.setStyleSheet("color: gray; font-size: 11px;")
+
+        self.image_area = QtWidgets.QScrollArea()
+        self.image_area.setWidget(self.image_label)
+        self.image_area.setWidgetResizable(True)
+        self.image_area.setAlignment(QtCore.Qt.AlignCenter)
+        self.image_area.setMinimumHeight(300)
+        self.image_area.setStyleSheet(
+            "QScrollArea { background: #f9f9f9; border: none; border-radius: 4px; }"
+        )
+        main_layout.addWidget(self.image_area, stretch=1)
+
+        image_tools_layout = QtWidgets.QHBoxLayout()
+        self.download_progress = QtWidgets.QProgressBar()
+        self.download_progress.setMaximumHeight(12)
+        self.download_progress.setTextVisible(False)
+        self.actual_size = QtWidgets.QCheckBox("Actual Size")
+        self.actual_size.toggled.connect(self.on_actual_size_toggled)
+        image_tools_layout.addWidget(self.download_progress)
+        image_tools_layout.addStretch()
+        image_tools_layout.addWidget(self.actual_size)
+        main_layout.addLayout(image_tools_layout)
+
+        # Additional images
+        self.thumbnails_layout = QtWidgets.QHBoxLayout()
+        self.thumbnails_layout.setContentsMargins(0, 0, 0, 0)
+        self.thumbnails_layout.setSpacing(6)
+        thumbnails_widget = QtWidgets.QWidget()
+        thumbnails_widget.setLayout(self.thumbnails_layout)
+        self.thumbnails_area = QtWidgets.QScrollArea()
+        self.thumbnails_area.setWidget(thumbnails_widget)
+        self.thumbnails_area.setWidgetResizable(True)
+        self.thumbnails_area.setFixedHeight(96)
+        self.thumbnails_area.setFrameShape(QtWidgets.QFrame.NoFrame)
+        main_layout.addWidget(self.thumbnails_area)
+
+        # Metadata
+        self.title_label = QtWidgets.QLabel()
+        font = self.title_label.font()
+        font.setBold(True)
+        font.setPointSize(15)
+        self.title_label.setFont(font)
+        self.title_label.setWordWrap(True)
+        self.title_label.setStyleSheet("color: #000;")
+
+        self.metadata_label = QtWidgets.QLabel()
+        self.metadata_label.setWordWrap(True)
+        self.metadata_label.setTextFormat(QtCore.Qt.RichText)
+        self.metadata_label.setOpenExternalLinks(True)
+        self.metadata_label.setStyleSheet("color: #666; font-size: 12px;")
+
+        main_layout.addWidget(self.title_label)
+        main_layout.addWidget(self.metadata_label)
+
+        # More like this
+        self.similar_label = QtWidgets.QLabel("More like this")
+        similar_font = self.similar_label.font()
+        similar_font.setBold(True)
+        self.similar_label.setFont(similar_font)
+        self.similar_list = QtWidgets.QListWidget()
+        self.similar_list.setMaximumHeight(140)
+        self.similar_list.itemClicked.connect(
+            lambda item: self.similar_selected.emit(item.data(QtCore.Qt.UserRole))
+        )
+        main_layout.addWidget(self.similar_label)
+        main_layout.addWidget(self.similar_list)
+
+    def clear(self):
+        """
+        Show the empty state
+        """
+        self.stop()
+        self.record = None
+        self.image_urls = []
+        self.image_url = None
+        self.clear_thumbnails()
+        self.fit_pixmap = None
+        self.full_pixmap = None
+        self.image_label.clear()
+        self.image_label.setText("Select an object to see its details")
+        self.title_label.setText("")
+        self.metadata_label.setText("")
+        self.download_progress.hide()
+        self.set_similar_ids([])
+
+    def clear_thumbnails(self):
+        """
+        Remove the additional images strip
+        """
+        self.thumbnail_buttons = {}
+        while self.thumbnails_layout.count():
+            item = self.thumbnails_layout.takeAt(0)
+            if item.widget():
+                item.widget().deleteLater()
+
+        self.thumbnails_area.hide()
+
+    def show_record(self, record: Dict):
+        """
+        Show a record, its metadata and images
+
+        :param record: Record data from the API
+        """
+        self.clear()
+        self.record = record
+
+        self.title_label.setText(record.get("title", "Untitled") or "Untitled")
+
+        rows = [
+            (record.get("artistDisplayName"), record.get("artistDisplayBio")),
+            (record.get("objectDate"), None),
+            (record.get("medium"), None),
+            (record.get("dimensions"), None),
+            (record.get("department"), None),
+            (record.get("creditLine"), None),
+        ]
+        lines = []
+        for value, extra in rows:
+            if value:
+                line = f"{value} ({extra})" if extra else value
+                lines.append(html.escape(line))
+
+        if record.get("objectURL"):
+            url = html.escape(record["objectURL"], quote=True)
+            lines.append(f'<a href="{url}">View on metmuseum.org</a>')
+
+        self.metadata_label.setText("<br>".join(lines))
+
+        if not record.get("isPublicDomain"):
+            self.image_label.setText("Image Not In The Public Domain")
+            return
+
+        if not record.get("primaryImage"):
+            self.image_label.setText("No Image")
+            return
+
+        self.image_urls = [record["primaryImage"]] + [
+            url for url in record.get("additionalImages", []) if url
+        ]
+
+        # The results list already has the small image, show it until the full image arrives
+        size = round(THUMBNAIL_SIZE * self.devicePixelRatioF())
+        thumbnail = self.thumbnail_cache.load(
+            record.get("primaryImageSmall", ""), size, size
+        )
+        if thumbnail is not None:
+            thumbnail.setDevicePixelRatio(self.devicePixelRatioF())
+            self.fit_pixmap = QtGui.QPixmap.fromImage(thumbnail)
+            self.update_image()
+
+        self.show_image(0)
+
+        if len(self.image_urls) > 1:
+            self.setup_thumbnails()
+            self.prefetch_additional_images()
+
+    def set_similar_ids(self, record_ids: list[int]):
+        """
+        Start a new more like this list, the records are added as they are fetched
+
+        :param record_ids: IDs of the similar records, most similar first
+        """
+        self.similar_ranks = {
+            record_id: rank for rank, record_id in enumerate(record_ids)
+        }
+        self.similar_keys = []
+        self.similar_list.clear()
+        self.similar_label.setVisible(bool(record_ids))
+        self.similar_list.setVisible(bool(record_ids))
+
+    def add_similar(self, records: list[Dict]):
+        """
+        Add fetched records to the more like this list
+
+        :param records: Records data, records that are not in the current list are ignored
+        """
+        for record in records:
+            rank = self.similar_ranks.get(record.get("objectID"))
+            if rank is None:
+                continue
+
+            text = record.get("title", "Untitled") or "Untitled"
+            if record.get("objectDate"):
+                text = f"{text} ({record['objectDate']})"
+
+            item = QtWidgets.QListWidgetItem(text)
+            item.setToolTip(record.get("artistDisplayName", ""))
+            item.setData(QtCore.Qt.UserRole, record)
+
+            row = bisect.bisect_right(self.similar_keys, rank)
+            self.similar_keys.insert(row, rank)
+            self.similar_list.insertItem(row, item)
+
+    def setup_thumbnails(self):
+        """
+        Build the strip of additional images. The thumbnails are loaded once their full image is prefetched, so
+        every image is only downloaded once
+        """
+        for index, url in enumerate(self.image_urls):
+            button = ThumbnailButton(index, self.thumbnail_cache)
+            button.setText("...")
+            button.clicked.connect(self.show_image)
+            self.thumbnails_layout.addWidget(button)
+            self.thumbnail_buttons[url] = button
+
+        self.thumbnails_layout.addStretch()
+        self.thumbnails_area.show()
+
+    def prefetch_additional_images(self):
+        """
+        Download the additional images in the background while the user looks at the first one
+        """
+        self.prefetch_cancel = threading.Event()
+
+        for url in self.image_urls[1:]:
+            prefetcher = ImagePrefetcher(
+                url, self.thumbnail_cache, self.prefetch_cancel
+            )
+            prefetcher.signals.done.connect(self.on_image_prefetched)
+            self.prefetch_pool.start(prefetcher)
+
+    def on_image_prefetched(self, image_url: str):
+        """
+        A full image is on disk, so its thumbnail can be decoded from there
+
+        :param image_url: Url of the image
+        """
+        button = self.thumbnail_buttons.get(image_url)
+        if button:
+            button.load_image_from_url(image_url)
+
+    def show_image(self, index: int):
+        """
+        Start streaming one of the record's images
+
+        :param index: Index of the image in the record's images
+        """
+        if index >= len(self.image_urls):
+            return
+
+        image_url = self.image_urls[index]
+        self.stop_streamer()
+        self.full_pixmap = None
+
+        # Show the thumbnail as a placeholder when switching between images
+        button = self.thumbnail_buttons.get(image_url)
+        if index > 0 and button and button.pixmap() and not button.pixmap().isNull():
+            self.fit_pixmap = button.pixmap()
+            self.update_image()
+
+        self.image_url = image_url
+        self.start_streamer()
+
+    def start_streamer(self):
+        """
+        Stream the current image, at full resolution too if Actual Size is checked
+        """
+        self.stop_streamer()
+        self.download_progress.setValue(0)
+        self.download_progress.show()
+
+        viewport = self.image_area.viewport().size()
+        self.generation += 1
+        self.streamer = ImageStreamer(
+            self.image_url,
+            viewport.width(),
+            viewport.height(),
+            self.devicePixelRatioF(),
+            self.thumbnail_cache,
+            generation=self.generation,
+            full_resolution=self.actual_size.isChecked(),
+        )
+        self.streamer.progress.connect(self.on_stream_progress)
+        self.streamer.preview_ready.connect(self.on_preview_ready)
+        self.streamer.image_ready.connect(self.on_image_ready)
+        self.streamer.failed.connect(self.on_stream_failed)
+        self.streamer.start()
+
+    def on_stream_progress(self, generation: int, received: int, total: int):
+        """
+        Update the download progress
+
+        :param generation: Generation of the stream
+        :param received: Bytes received so far
+        :param total: Total bytes, 0 if the server didn't tell us
+        """
+        if generation != self.generation:
+            return
+
+        if total:
+            self.download_progress.setMaximum(total)
+            self.download_progress.setValue(received)
+        else:
+            # Unknown size, show a busy indicator
+            self.download_progress.setMaximum(0)
+
+    def on_preview_ready(self, generation: int, image: QtGui.QImage):
+        """
+        The image decoded at the size of the pane is ready
+
+        :param generation: Generation of the stream
+        :param image: Decoded image
+        """
+        if generation != self.generation:
+            return
+
+        self.download_progress.hide()
+        self.fit_pixmap = QtGui.QPixmap.fromImage(image)
+        self.update_image()
+
+        # The image is on disk now, so the strip can show its thumbnail without downloading anything
+        button = self.thumbnail_buttons.get(self.image_url)
+        if button and (button.pixmap() is None or button.pixmap().isNull()):
+            button.load_image_from_url(self.image_url)
+
+    def on_image_ready(self, generation: int, image: QtGui.QImage):
+        """
+        The full resolution image is ready
+
+        :param generation: Generation of the stream
+        :param image: Decoded image
+        """
+        if generation != self.generation:
+            return
+
+        self.full_pixmap = QtGui.QPixmap.fromImage(image)
+        self.update_image()
+
+    def on_stream_failed(self, generation: int, message: str):
+        """
+        Let the user know the image could not be loaded
+
+        :param generation: Generation of the stream
+        :param message: Message to display
+        """
+        if generation != self.generation:
+            return
+
+        self.download_progress.hide()
+        if self.fit_pixmap is None:
+            self.image_label.setText(message)
+
+    def on_actual_size_toggled(self, checked: bool):
+        """
+        Decode the full resolution image when it's needed and let go of it when it's not, it can take hundreds of
+        megabytes
+
+        :param checked: True if Actual Size was checked
+        """
+        if not checked:
+            self.full_pixmap = None
+        elif self.full_pixmap is None and self.image_url is not None:
+            # The original is on disk by now (or on its way), so this mostly costs the decode
+            self.start_streamer()
+
+        self.update_image()
+
+    def update_image(self):
+        """
+        Show the best image we have for the current mode
+        """
+        if self.actual_size.isChecked() and self.full_pixmap is not None:
+            self.image_area.setWidgetResizable(False)
+            self.image_label.setPixmap(self.full_pixmap)
+            self.image_label.adjustSize()
+        elif self.fit_pixmap is not None:
+            self.image_area.setWidgetResizable(True)
+            self.image_label.setPixmap(self.fit_pixmap)
+
+    def stop_streamer(self):
+        """
+        Stop the current stream without blocking, the thread is cleaned up once it ends
+        """
+        streamer = self.streamer
+        self.streamer = None
+
+        if streamer is None:
+            return
+
+        streamer.stop()
+
+        # Keep a reference until the thread is done, otherwise it would be destroyed while running
+        self.abandoned_streamers.add(streamer)
+        streamer.finished.connect(lambda: self.abandoned_streamers.discard(streamer))
+
+        if not streamer.isRunning():
+            self.abandoned_streamers.discard(streamer)
+
+    def stop(self):
+        """
+        Stop streaming and prefetching
+        """
+        self.prefetch_cancel.set()
+        self.prefetch_pool.clear()
+        self.stop_streamer()
+
+    def shutdown(self):
+        """
+        Stop everything and give the threads a moment to end, used when the app closes
+        """
+        self.stop()
+        for streamer in list(self.abandoned_streamers):
+            streamer.wait(2000)
+
+        self.prefetch_pool.waitForDone(2000)
@@ -0,0 +1,134 @@
+from typing import Dict, Optional
+from PySide6 import QtWidgets, QtCore
+from src.api.facet_index import FacetIndex
+
+# The drill down columns, every column is counted within the selection of the columns before it
+LEVELS = [
+    ("department", "Department"),
+    ("classification", "Classification"),
+    ("artist", "Artist"),
+]
+
+
+class FacetBrowser(QtWidgets.QDialog):
+    """
+    Drill down from department to classification to artist. Every level lists its values with the number of
+    records within the selection so far, all answered from the facet index without fetching anything
+    """
+
+    # Records of the selection and a description of it
+    records_selected = QtCore.Signal(list, str)
+
+    def __init__(
+        self,
+        facet_index: FacetIndex,
+        parent: Optional[QtWidgets.QWidget] = None,
+    ):
+        """
+        Initialize the dialog
+
+        :param facet_index: Posting lists to browse
+        :param parent: Parent widget
+        """
+        super().__init__(parent=parent)
+        self.facet_index = facet_index
+        self.setWindowTitle("Browse by Department")
+        self.resize(900, 500)
+        self.lists = []
+        self.setup_ui()
+        self.fill_level(0)
+
+    def setup_ui(self):
+        main_layout = QtWidgets.QHBoxLayout()
+        main_layout.setSpacing(12)
+        self.setLayout(main_layout)
+
+        for level, (_, title) in enumerate(LEVELS):
+            column_layout = QtWidgets.QVBoxLayout()
+            label = QtWidgets.QLabel(title)
+            font = label.font()
+            font.setBold(True)
+            font.setPointSize(13)
+            label.setFont(font)
+
+            values_list = QtWidgets.QListWidget()
+            values_list.currentItemChanged.connect(
+                lambda current, previous, level=level: self.on_value_selected(
+                    level, current
+                )
+            )
+            self.lists.append(values_list)
+
+            column_layout.addWidget(label)
+            column_layout.addWidget(values_list)
+            main_layout.addLayout(column_layout)
+
+    def filters(self, levels: int) -> Dict[str, str]:
+        """
+        Values selected in the first columns
+
+        :param levels: Number of columns to look at
+        :returns: Dictionary of facets and their selected value
+        """
+        filters = {}
+        for (facet, _), values_list in zip(LEVELS[:levels], self.lists):
+            item = values_list.currentItem()
+            if item is None:
+                break
+
+            filters[facet] = item.data(QtCore.Qt.UserRole)
+
+        return filters
+
+    def fill_level(self, level: int):
+        """
+        List the values of a column with their counts within the selection of the columns before it, the columns
+        after it are emptied
+
+        :param level: Index of the column
+        """
+        for values_list in self.lists[level:]:
+            values_list.blockSignals(True)
+            values_list.clear()
+            values_list.blockSignals(False)
+
+        facet = LEVELS[level][0]
+        filters = self.filters(level)
+        if level and len(filters) < level:
+            # Nothing selected in the column before
+            return
+
+        within = self.facet_index.query(filters) if filters else None
+        counts = self.facet_index.counts(facet, within)
+
+        # Departments and classifications are few and read best by name, artists by how much they made
+        if facet == "artist":
+            values = sorted(counts, key=lambda v: (-counts[v], v.lower()))
+        else:
+            values = sorted(counts, key=str.lower)
+
+        values_list = self.lists[level]
+        values_list.setUpdatesEnabled(False)
+        for value in values:
+            item = QtWidgets.QListWidgetItem(f"{value} ({counts[value]:,})")
+            item.setData(QtCore.Qt.UserRole, value)
+            values_list.addItem(item)
+
+        values_list.setUpdatesEnabled(True)
+
+    def on_value_selected(self, level: int, current):
+        """
+        Fill the next column and show the records of the selection
+
+        :param level: Index of the column
+        :param current: Selected item
+        """
+        if current is None:
+            return
+
+        if level + 1 < len(LEVELS):
+            self.fill_level(level + 1)
+
+        filters = self.filters(level + 1)
+        record_ids = self.facet_index.query(filters)
+        self.records_selected.emit(record_ids.tolist(), " → ".join(filters.values()))
@@ -1,11 +1,52 @@
-from typing import Dict
+import bisect
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
 from PySide6 import QtGui, QtWidgets, QtCore
-from src.ui.widgets import ClassificationWidget, ResultWidget
+from src.ui.widgets import ClassificationWidget, DateHistogram, ResultWidget
+from src.ui.detail_view import DetailView
+from src.ui.facet_browser import FacetBrowser
 from src.api.classification_index import ClassificationIndex
+from src.api.date_index import DateIndex
+from src.api.facet_index import FacetIndex
 from src.api.met_api import MetAPI
 from src.api.image_record_cache import ImageRecordCache
-from src.ui.worker import Fetcher
-from pprint import pprint
+from src.api.thumbnail_cache import THUMBNAIL_SIZE, ThumbnailCache
+from src.api.record_store import RecordStore
+from src.api.image_availability import ImageAvailabilityIndex
+from src.api.page_sizer import PageSizer
+from src.api.rate_limiter import RateLimiter
+from src.api.memory_budget import BudgetedCache, MemoryBudget
+from src.api.session_store import SessionStore
+from src.api.similarity_index import SimilarityIndex
+from src.ui.worker import (
+    Exporter,
+    Fetcher,
+    ImageVerifier,
+    MaintenanceWorker,
+    MemoryMonitor,
+)
+from loguru import logger
+
+# Seconds without any input before background maintenance may run
+IDLE_DELAY = 30
+# Number of most visited classifications that are kept warm
+WARM_CLASSIFICATIONS = 5
+# Export formats of the save dialog's file type filters
+EXPORT_FILTERS = {
+    "JSON Lines (*.jsonl)": "jsonl",
+    "CSV (*.csv)": "csv",
+    "Parquet (*.parquet)": "parquet",
+}
+# Events that count as the user doing something
+USER_INPUT_EVENTS = {
+    QtCore.QEvent.MouseButtonPress,
+    QtCore.QEvent.MouseButtonDblClick,
+    QtCore.QEvent.MouseMove,
+    QtCore.QEvent.KeyPress,
+    QtCore.QEvent.Wheel,
+}
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -17,16 +58,79 @@ class MainWindow(QtWidgets.QMainWindow):
         super(MainWindow, self).__init__(parent)
 
         self.setWindowTitle("Met Browser")
-        self.setMinimumSize(1000, 600)
+        self.setMinimumSize(1300, 700)
         self.fetcher_thread = None
+        self.exporter_thread = None
+        # Every fetch gets a new generation, results tagged with an older one are stale
+        self.fetch_generation = 0
+        # Cancelled fetchers we keep alive until their thread actually ends
+        self.abandoned_fetchers = set()
+        # The API's rate limit is for all of our requests, so every thread making them shares this limiter (the
+        # background threads through slower limiters of their own). Its remaining budget caps the page size
+        self.api_limiter = RateLimiter()
+        self.page_sizer = PageSizer(self.api_limiter)
+        # All records of the current selection, fetched a page at a time as the user scrolls
+        self.page_record_ids = []
+        self.page_offset = 0
+        # Where the page that is being fetched starts in page_record_ids
+        self.page_start = 0
+        # Classification of the current selection, None for a selection from the facet browser
+        self.page_classification = None
+        # True when the pages are in date order, then every page goes at the end of the list
+        self.pages_in_order = False
+        # True while a page is being fetched
+        self.page_pending = False
+        # Fetches the more like this records of the record in the detail column
+        self.similar_fetcher = None
+        self.similar_generation = 0
         self.local_api = ClassificationIndex()
+        self.date_index = DateIndex()
+        self.facet_index = FacetIndex()
+        self.facet_browser = None
         self.met_api = MetAPI()
         self.image_cache = ImageRecordCache()
         self.records_with_images = self.image_cache.load_cache()
+        self.setup_memory_budget()
+        self.thumbnail_cache = ThumbnailCache(
+            memory_cache=BudgetedCache(
+                "Thumbnails",
+                self.memory_budget,
+                size_of=lambda image: image.sizeInBytes(),
+                cost=2.0,
+            )
+        )
+        self.record_store = RecordStore(
+            memory_cache=BudgetedCache(
+                "Records",
+                self.memory_budget,
+                size_of=lambda record: len(str(record)),
+            )
+        )
+        # Filtered record IDs per classification, so the count badges don't redo set operations. One entry per
+        # classification, tagged with the availability version it was computed for
+        self.query_cache = BudgetedCache(
+            "Query results",
+            self.memory_budget,
+            # Roughly what a set entry and its int cost
+            size_of=lambda entry: sum(len(ids) for ids in entry[1]) * 64,
+        )
+        self.image_availability = ImageAvailabilityIndex()
+        self.similarity_index = SimilarityIndex()
+        # Maps classification names to their list widgets
+        self.classification_widgets = {}
         self.current_results = []
+        # Sort keys of current_results, kept in step with it for inserting in sorted position
+        self.current_result_keys = []
+        # How often every classification was opened, saved with the session
+        self.classification_visits = Counter()
+        self.visited_classification = None
         self.setup_progress_bar()
         self.set_ui()
         self.create_menubar()
+        self.setup_image_verifier()
+        self.session_store = SessionStore()
+        self.restore_session()
+        self.setup_maintenance()
         self.setStyleSheet("""
                     QMainWindow {
                         background-color: #f5f5f5;
@@ -136,6 +240,7 @@ class MainWindow(QtWidgets.QMainWindow):
             item = QtWidgets.QListWidgetItem(self.classifications_list)
             records = [int(r) for r in value]
             item_widget = ClassificationWidget(key, records, main_window=self)
+            self.classification_widgets[key] = item_widget
             item.setSizeHint(item_widget.sizeHint())
             self.classifications_list.setItemWidget(item, item_widget)
 
@@ -159,16 +264,33 @@ class MainWindow(QtWidgets.QMainWindow):
         sorting_label.setFont(sorting_font)
         self.sorting_combo = QtWidgets.QComboBox()
         self.sorting_combo.addItems(["Ascending", "Descending"])
-        self.sorting_combo.currentIndexChanged.connect(self.populate_results)
+        self.sorting_combo.currentIndexChanged.connect(self.on_sort_changed)
 
         results_layout.addWidget(sorting_label)
         results_layout.addWidget(self.sorting_combo)
 
+        # Brushing the histogram narrows the results down to a period
+        self.date_histogram = DateHistogram()
+        self.date_histogram.setToolTip("Drag to select a period, double click to reset")
+        self.date_histogram.range_selected.connect(self.on_date_range_changed)
+        self.date_histogram.selection_cleared.connect(self.on_date_range_changed)
+        self.date_histogram.hide()
+        results_layout.addWidget(self.date_histogram)
+
         self.results_list = QtWidgets.QListWidget()
         self.results_list.setFrameShape(QtWidgets.QFrame.NoFrame)
         self.results_list.setSpacing(0)
+        self.results_list.currentItemChanged.connect(self.on_result_selected)
+        self.results_list.verticalScrollBar().valueChanged.connect(
+            self.on_results_scrolled
+        )
         results_layout.addWidget(self.results_list)
 
+        # Detail column
+        self.detail_view = DetailView(self.thumbnail_cache)
+        self.detail_view.similar_selected.connect(self.show_detail)
+        columns_layout.addWidget(self.detail_view, stretch=1)
+
     def setup_progress_bar(self):
         """
         Setup a progress bar at the bottom right of the window
@@ -180,22 +302,301 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.statusBar().addPermanentWidget(self.progress_bar)
 
+    def setup_memory_budget(self):
+        """
+        All in memory caches share a single budget. The system memory is sampled regularly on a background thread
+        so the caches shrink when the machine runs low
+        """
+        self.memory_budget = MemoryBudget()
+
+        self.memory_monitor = MemoryMonitor()
+        self.memory_monitor.low_memory.connect(self.on_low_memory)
+        self.memory_monitor.start()
+
+    def on_low_memory(self, available: int):
+        """
+        Trim the caches on the UI thread, they are used from here
+
+        :param available: Available system memory in bytes
+        """
+        self.memory_budget.check_memory_pressure(available)
+
+    def setup_image_verifier(self):
+        """
+        Start the background thread that verifies which records really have a displayable image. It uses a low
+        request rate so it leaves most of the API budget for interactive fetches
+        """
+        self.image_verifier = ImageVerifier(
+            self.met_api,
+            self.record_store,
+            self.image_availability,
+            RateLimiter(rate=5, parent=self.api_limiter),
+        )
+        self.image_verifier.verified.connect(self.on_records_verified)
+        self.image_verifier.start()
+
+    def setup_maintenance(self):
+        """
+        Start the background maintenance thread. It only runs while the user is idle and no other thread uses the
+        network, any input pauses it straight away
+        """
+        self.maintenance = MaintenanceWorker(
+            self.met_api,
+            self.record_store,
+            self.thumbnail_cache,
+            self.image_availability,
+            self.image_cache,
+            RateLimiter(rate=2, parent=self.api_limiter),
+            device_pixel_ratio=self.devicePixelRatioF(),
+        )
+        self.maintenance.task_started.connect(
+            lambda name: self.statusBar().showMessage(f"{name}...", 3000)
+        )
+        self.maintenance.verified.connect(self.on_records_verified)
+        self.maintenance.image_cache_refreshed.connect(self.on_image_cache_refreshed)
+        self.maintenance.start()
+
+        self.last_interaction = time.monotonic()
+        QtWidgets.QApplication.instance().installEventFilter(self)
+
+        self.idle_timer = QtCore.QTimer(self)
+        self.idle_timer.setInterval(5000)
+        self.idle_timer.timeout.connect(self.check_idle)
+        self.idle_timer.start()
+
+    def eventFilter(self, watched: QtCore.QObject, event: QtCore.QEvent) -> bool:
+        """
+        Pause maintenance on any user input, this sees the events of every widget in the app
+        """
+        if event.type() in USER_INPUT_EVENTS:
+            self.last_interaction = time.monotonic()
+            self.maintenance.pause()
+
+        return super().eventFilter(watched, event)
+
+    def check_idle(self):
+        """
+        Resume maintenance once the user has been idle for a while and the network is quiet
+        """
+        idle = time.monotonic() - self.last_interaction >= IDLE_DELAY
+        if not idle or self.network_busy():
+            self.maintenance.pause()
+            return
+
+        if self.maintenance.paused:
+            self.update_maintenance_targets()
+            self.maintenance.resume()
+
+    def network_busy(self) -> bool:
+        """
+        Check if any interactive work is using the network. The image verifier doesn't count, it and maintenance
+        share their part of the rate limit through the parent limiter
+        """
+        threads = [
+            self.fetcher_thread,
+            self.similar_fetcher,
+            self.exporter_thread,
+            self.detail_view.streamer,
+        ]
+        return any(thread is not None and thread.isRunning() for thread in threads)
+
+    def update_maintenance_targets(self):
+        """
+        Tell the maintenance thread which classifications the user opens most
+        """
+        warm_pages = []
+        unverified = []
+        for classification, _ in self.classification_visits.most_common(
+            WARM_CLASSIFICATIONS
+        ):
+            widget = self.classification_widgets.get(classification)
+            if widget is None:
+                continue
+
+            first_page = self.page_sizer.first_page(self.visible_rows())
+            record_ids = self.paged_order(widget.filtered_record_ids, classification)
+            warm_pages.append(record_ids[:first_page])
+            unverified.extend(sorted(widget.image_record_ids()[1]))
+
+        self.maintenance.set_targets(warm_pages, unverified)
+
+    def on_image_cache_refreshed(self):
+        """
+        The maintenance thread searched the records with images again
+        """
+        self.records_with_images = self.image_cache.load_cache()
+        # The filtered records were computed from the old cache
+        self.query_cache.clear()
+        self.update_all_classification_counts()
+
     def create_menubar(self):
         """
         Create a menu bar with File and Tools menus
         """
         menubar = self.menuBar()
         file_menu = menubar.addMenu("File")
+        export_action = QtGui.QAction("Export Classification...", self)
+        export_action.setShortcut(QtGui.QKeySequence("Ctrl+E"))
+        export_action.triggered.connect(self.export_classification_callback)
+        file_menu.addAction(export_action)
+        file_menu.addSeparator()
+
         quit_action = QtGui.QAction("Quit", self)
         quit_action.setShortcut(QtGui.QKeySequence("Ctrl+Q"))
         quit_action.triggered.connect(self.close)
         file_menu.addAction(quit_action)
 
         tools_menu = menubar.addMenu("Tools")
+        browse_action = QtGui.QAction("Browse by Department...", self)
+        browse_action.setShortcut(QtGui.QKeySequence("Ctrl+B"))
+        browse_action.setEnabled(self.facet_index.available)
+        browse_action.triggered.connect(self.show_facet_browser)
+        tools_menu.addAction(browse_action)
+
         refresh_cache_action = QtGui.QAction("Refresh Image Cache...", self)
         refresh_cache_action.triggered.connect(self.refresh_image_cache_callback)
         tools_menu.addAction(refresh_cache_action)
 
+        memory_usage_action = QtGui.QAction("Memory Usage...", self)
+        memory_usage_action.triggered.connect(self.show_memory_usage)
+        tools_menu.addAction(memory_usage_action)
+
+    def show_facet_browser(self):
+        """
+        Open the department → classification → artist browser, it stays open next to the main window
+        """
+        if self.facet_browser is None:
+            self.facet_browser = FacetBrowser(self.facet_index, parent=self)
+            self.facet_browser.records_selected.connect(self.on_facet_records_selected)
+
+        self.facet_browser.show()
+        self.facet_browser.raise_()
+
+    def on_facet_records_selected(self, record_ids: list[int], description: str):
+        """
+        Show the records of a selection in the facet browser in the results column
+
+        :param record_ids: Record IDs of the selection
+        :param description: The selected values
+        """
+        # The results no longer belong to a classification
+        self.classifications_list.blockSignals(True)
+        self.classifications_list.setCurrentItem(None)
+        self.classifications_list.blockSignals(False)
+        self.date_histogram.set_dates(None)
+        self.visited_classification = None
+
+        total = len(record_ids)
+        if self.has_images.isChecked():
+            verified, unverified = self.image_availability.split_image_records(
+                set(record_ids), self.records_with_images
+            )
+            record_ids = sorted(verified) + sorted(unverified)
+
+        self.load_records(record_ids)
+        self.statusBar().showMessage(f"{description}: {total:,} objects", 5000)
+
+    def export_classification_callback(self):
+        """
+        Export every record of the selected classification (respecting the image filter), not just the loaded page
+        """
+        selected = self.classifications_list.selectedItems()
+        if not selected:
+            QtWidgets.QMessageBox.information(
+                self, "Export", "Select a classification to export first"
+            )
+            return
+
+        if self.exporter_thread and self.exporter_thread.isRunning():
+            QtWidgets.QMessageBox.information(
+                self, "Export", "An export is already running"
+            )
+            return
+
+        widget = self.classifications_list.itemWidget(selected[0])
+        path, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            "Export Classification",
+            f"{widget.classification}.jsonl",
+            ";;".join(EXPORT_FILTERS),
+        )
+        if not path:
+            return
+
+        # A known extension wins, otherwise the file type picked in the dialog decides and is added to the name
+        path = Path(path)
+        export_format = path.suffix.lstrip(".").lower()
+        if export_format not in EXPORT_FILTERS.values():
+            export_format = EXPORT_FILTERS.get(selected_filter, "jsonl")
+            path = path.with_name(f"{path.name}.{export_format}")
+
+        self.exporter_thread = Exporter(
+            self.met_api,
+            self.record_store,
+            widget.filtered_record_ids,
+            path,
+            export_format=export_format,
+            limiter=self.api_limiter,
+            # filtered_record_ids includes unverified candidates, the export verifies them on the way
+            image_availability=(
+                self.image_availability if self.has_images.isChecked() else None
+            ),
+        )
+        self.exporter_thread.progress.connect(self.on_export_progress)
+        self.exporter_thread.export_finished.connect(self.on_export_finished)
+        self.exporter_thread.error.connect(self.on_export_error)
+        self.exporter_thread.start()
+
+    def on_export_progress(self, current: int, total: int, message: str):
+        """
+        Show export progress in the status bar
+
+        :param current: Number of records written
+        :param total: Total records to export
+        :param message: Message to display to the user
+        """
+        self.statusBar().showMessage(message)
+
+    def on_export_finished(self, written: int, path: str):
+        """
+        Let the user know the export is done
+
+        :param written: Number of records written
+        :param path: Path of the exported file
+        """
+        self.statusBar().showMessage(f"Exported {written} records to {path}", 5000)
+
+    def on_export_error(self, error_message: str):
+        """
+        Let the user know the export failed
+
+        :param error_message: The error message from the exporter
+        """
+        self.statusBar().clearMessage()
+        QtWidgets.QMessageBox.critical(
+            self, "Export failed!", f"Failed to export records {error_message}"
+        )
+
+    def show_memory_usage(self):
+        """
+        Show how much memory every cache uses
+        """
+        megabyte = 1024 * 1024
+        lines = []
+        for name, usage in self.memory_budget.usage().items():
+            lines.append(
+                f"{name}: {usage['bytes'] / megabyte:.1f} MB ({usage['entries']} entries)"
+            )
+
+        msg = QtWidgets.QMessageBox(self)
+        msg.setWindowTitle("Memory Usage")
+        msg.setText(
+            f"{self.memory_budget.used_bytes / megabyte:.1f} MB of "
+            f"{self.memory_budget.limit_bytes / megabyte:.0f} MB used by caches"
+        )
+        msg.setInformativeText("\n".join(lines))
+        msg.exec()
+
     def refresh_image_cache_callback(self):
         """
         Ask the user if they really want to update the cache, since it takes a while
@@ -240,8 +641,9 @@ class MainWindow(QtWidgets.QMainWindow):
             # Fetch the new cache
             self.image_cache.save_cache(progress_callback=progress_callback)
 
-            # Load it into the app
+            # Load it into the app, the filtered records were computed from the old cache
             self.records_with_images = self.image_cache.load_cache()
+            self.query_cache.clear()
 
             self.progress_bar.hide()
             self.statusBar().showMessage(
@@ -269,8 +671,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def on_classification_item_selected(self, current, previous):
         """
-        When a classification is selected we fetch 80 records from the database, and display them in the results column.
-        This uses a thread so we don't lock up the UI and provide constant updates
+        When a classification is selected we fetch its first page of records from the database, and display them in the
+        results column. This uses a thread so we don't lock up the UI and provide constant updates
 
         :param current: Current ListItemWidget selected in the UI
         :param previous: Previous ListItemWidget selected in the UI (Not used)
@@ -278,50 +680,316 @@ class MainWindow(QtWidgets.QMainWindow):
         if not current:
             return
 
-        # If we already have a process running stop it
-        if self.fetcher_thread and self.fetcher_thread.isRunning():
-            self.fetcher_thread.stop()
-            self.fetcher_thread.wait()
+        # Get record ids
+        widget = self.classifications_list.itemWidget(current)
+        self.date_histogram.set_dates(self.date_index.get(widget.classification))
+
+        # Toggling filters reloads the same classification, that's not another visit
+        if widget.classification != self.visited_classification:
+            self.visited_classification = widget.classification
+            self.classification_visits[widget.classification] += 1
+        record_ids = self.selected_record_ids(widget)
+
+        if self.has_images.isChecked():
+            # Make the count of the selected classification exact as soon as possible. Only the unverified
+            # candidates can change it, the other records are known not to have an image
+            self.image_verifier.queue(widget.image_record_ids()[1], priority=True)
+
+        self.load_records(record_ids, widget.classification)
+
+    def selected_record_ids(self, widget: ClassificationWidget) -> list[int]:
+        """
+        Records of a classification that match the filters and the selected period. The period comes straight from
+        the date index, so nothing is fetched to find out which records are in it
+
+        :param widget: Widget of the classification
+        :returns: Record IDs in the order they are paged
+        """
+        dates = self.date_histogram.dates
+        selection = self.date_histogram.selection
+        if dates is None or selection is None:
+            return widget.filtered_record_ids
+
+        in_range = dates.ids_in_bins(*selection)
+        if not self.has_images.isChecked():
+            return in_range.tolist()
+
+        # Same order as filtered_record_ids, verified records first
+        verified, unverified = widget.image_record_ids()
+        return [r for r in in_range if r in verified] + [
+            r for r in in_range if r in unverified
+        ]
+
+    def on_date_range_changed(self, *selection):
+        """
+        Reload the results when a period is selected in the histogram or the selection is cleared
+
+        :param selection: First bin and the bin after the last one, empty when the selection is cleared
+        """
+        dates = self.date_histogram.dates
+        if dates is not None and selection:
+            count = dates.count_bins(*selection)
+            self.statusBar().showMessage(
+                f"{dates.bin_label(*selection)}: {count:,} objects", 3000
+            )
+
+        self.on_classification_item_selected(
+            self.classifications_list.currentItem(), None
+        )
+
+    def set_pages(self, record_ids: list[int], classification: Optional[str] = None):
+        """
+        Page through a selection. With a date index the records are paged in the order they are shown, so every
+        page goes below the rows that are already there and the sort covers the whole selection, not just what
+        is loaded
+
+        :param record_ids: IDs of all records of the selection
+        :param classification: Classification of the selection, if it's from one
+        """
+        self.page_classification = classification
+        self.page_offset = 0
+        self.pages_in_order = self.date_index.available
+        self.page_record_ids = self.paged_order(record_ids, classification)
+
+    def paged_order(
+        self, record_ids: list[int], classification: Optional[str] = None
+    ) -> list[int]:
+        """
+        Order in which the records of a selection are paged, by date in the sort direction if we have a date index.
+        With has images on the verified records still come first and only the unverified candidates after them,
+        each group is sorted by date on its own
+
+        :param record_ids: IDs of all records of the selection
+        :param classification: Classification of the selection, if it's from one
+        :returns: Ordered record IDs
+        """
+        if not self.date_index.available:
+            return record_ids
+
+        descending = self.sorting_combo.currentText().lower() != "ascending"
+        if not self.has_images.isChecked():
+            return self.date_index.sort_by_date(
+                record_ids, classification, descending=descending
+            )
+
+        verified = self.image_availability.displayable_in(set(record_ids))
+        groups = (
+            [r for r in record_ids if r in verified],
+            [r for r in record_ids if r not in verified],
+        )
+        return [
+            record_id
+            for group in groups
+            for record_id in self.date_index.sort_by_date(
+                group, classification, descending=descending
+            )
+        ]
+
+    def load_records(
+        self, record_ids: list[int], classification: Optional[str] = None
+    ):
+        """
+        Replace the results column with the given records. Any fetch that is still running is abandoned without
+        waiting for it, so switching is instant. Only the first page is fetched, the rest follows as the user scrolls
+
+        :param record_ids: IDs of all records of the selection
+        :param classification: Classification of the selection, if it's from one
+        """
+        self.cancel_fetch()
+
+        # Set up the new selection first, clearing the list scrolls it and that may already fetch the first page
+        self.set_pages(record_ids, classification)
+        self.fetch_generation += 1
 
         # Clear existing results
         self.current_results = []
+        self.current_result_keys = []
         self.results_list.clear()
 
-        # Get record ids
-        widget = self.classifications_list.itemWidget(current)
-        record_ids = widget.filtered_record_ids[:80]
+        self.fetch_next_page()
+
+    def fetch_next_page(self):
+        """
+        Fetch the next page of the current selection. The first page is what fits on screen, later pages are sized
+        from the measured latency, scroll speed and the rate limit budget that is left
+        """
+        if self.page_pending or self.page_offset >= len(self.page_record_ids):
+            return
+
+        visible_rows = self.visible_rows()
+        if self.page_offset == 0:
+            size = self.page_sizer.first_page(visible_rows)
+        else:
+            size = self.page_sizer.next_page(visible_rows)
+
+        record_ids = self.page_record_ids[self.page_offset : self.page_offset + size]
+        # Where the page starts, a failed page continues from here
+        self.page_start = self.page_offset
+        self.page_offset += len(record_ids)
+        self.page_pending = True
 
         # Setup the progress bar
         self.progress_bar.setMaximum(len(record_ids))
         self.progress_bar.setValue(0)
         self.progress_bar.show()
 
-        # Start a thread so we don't lock the UI
-        self.fetcher_thread = Fetcher(self.met_api, record_ids)
+        # Start a thread so we don't lock the UI, the previous page's thread may still be winding down
+        self.abandon_fetcher(self.fetcher_thread)
+        self.fetcher_thread = Fetcher(
+            self.met_api,
+            record_ids,
+            generation=self.fetch_generation,
+            store=self.record_store,
+            limiter=self.api_limiter,
+            page_sizer=self.page_sizer,
+        )
         self.fetcher_thread.progress.connect(self.on_fetch_progress)
-        self.fetcher_thread.result_ready.connect(self.on_result_ready)
-        self.fetcher_thread.finished.connect(self.on_fetch_finished)
+        self.fetcher_thread.results_ready.connect(self.on_results_ready)
+        self.fetcher_thread.fetch_finished.connect(self.on_fetch_finished)
         self.fetcher_thread.error.connect(self.on_fetch_error)
         self.fetcher_thread.start()
 
         self.statusBar().showMessage("Loading results...")
 
-    def on_fetch_progress(self, current: int, total: int, message: str):
+    def visible_rows(self) -> int:
+        """
+        Number of result rows that fit in the results column
+        """
+        row_height = 0
+        if self.results_list.count():
+            row_height = self.results_list.sizeHintForRow(0)
+
+        if row_height <= 0:
+            # Nothing to measure yet, every row is at least as high as its thumbnail
+            row_height = THUMBNAIL_SIZE + 16
+
+        return max(1, self.results_list.viewport().height() // row_height)
+
+    def rows_below_viewport(self) -> int:
+        """
+        Number of loaded rows below the bottom of the results column
+        """
+        viewport = self.results_list.viewport()
+        index = self.results_list.indexAt(QtCore.QPoint(0, viewport.height() - 1))
+        if not index.isValid():
+            # The rows don't fill the column
+            return 0
+
+        return self.results_list.count() - 1 - index.row()
+
+    def load_more_if_needed(self):
+        """
+        Fetch the next page once less than a screen of loaded rows is left below the viewport
+        """
+        if self.rows_below_viewport() < self.visible_rows():
+            self.fetch_next_page()
+
+    def on_results_scrolled(self, value: int):
+        """
+        Measure the scroll speed and load more results when the user gets close to the end
+
+        :param value: Position of the scroll bar (not used, it's in pixels or rows depending on the scroll mode)
+        """
+        top = self.results_list.indexAt(QtCore.QPoint(0, 0)).row()
+        if top >= 0:
+            self.page_sizer.record_scroll(top)
+
+        self.load_more_if_needed()
+
+    def on_page_finished(self, generation: int):
+        """
+        A page is done, fetch the next one straight away if the user can already see the end of the results
+
+        :param generation: Generation of the fetch
+        """
+        if not self.is_current_generation(generation):
+            return
+
+        self.page_pending = False
+        # The new rows may not be laid out yet, they have to be to see what is below the viewport
+        self.results_list.doItemsLayout()
+        self.load_more_if_needed()
+
+    def cancel_fetch(self):
+        """
+        Stop the current fetch without blocking. The thread aborts its request and is cleaned up once it ends
+        """
+        fetcher = self.fetcher_thread
+        self.fetcher_thread = None
+        self.page_pending = False
+        self.abandon_fetcher(fetcher)
+
+    def abandon_fetcher(self, fetcher: Optional[Fetcher]):
+        """
+        Stop a fetcher without waiting for it
+
+        :param fetcher: The fetcher to stop, None is ignored
+        """
+        if fetcher is None:
+            return
+
+        fetcher.stop()
+
+        # Keep a reference until the thread is done, otherwise it would be destroyed while running
+        self.abandoned_fetchers.add(fetcher)
+        fetcher.finished.connect(lambda: self.abandoned_fetchers.discard(fetcher))
+
+        if not fetcher.isRunning():
+            self.abandoned_fetchers.discard(fetcher)
+
+    def is_current_generation(self, generation: int) -> bool:
+        """
+        Check if a signal comes from the fetch that is currently displayed
+
+        :param generation: Generation the signal was emitted for
+        :returns: True if the results belong in the results list
+        """
+        return generation == self.fetch_generation
+
+    def on_fetch_progress(
+        self, generation: int, current: int, total: int, message: str
+    ):
         """
         Update progress as results load
+        :param generation: Generation of the fetch
         :param current: Current number of record being processed
         :param total: Total records to process
         :param message: Message to display to the user
         """
+        if not self.is_current_generation(generation):
+            return
+
         self.progress_bar.setValue(current)
         self.statusBar().showMessage(message)
 
-    def on_result_ready(self, result: Dict):
+    def on_results_ready(self, generation: int, results: list[Dict]):
         """
-        When a single record finishes processing we add it to the results list and to the gui
+        When a batch of records finishes processing we insert each of them into the results list at its sorted
+        position, the list is laid out once per batch
+
+        :param generation: Generation of the fetch
+        :param results: Batch of records data from the API
+        """
+        if not self.is_current_generation(generation):
+            return
+
+        self.results_list.setUpdatesEnabled(False)
+
+        for result in results:
+            self.insert_result(result, at_end=self.pages_in_order)
+
+        self.results_list.setUpdatesEnabled(True)
+
+    def insert_result(self, result: Dict, at_end: bool = False):
+        """
+        Insert a record into the results list at its sorted position
 
         :param result: Record data from the API
+        :param at_end: Add it below everything instead, for records that are fetched in the order they are shown
         """
+        # Every fetched record tells us for sure if it has an image
+        self.image_availability.update_from_record(result)
+
         # We need to filter results without images since the API is unreliable
         if self.has_images.isChecked():
             image_url = result.get("primaryImageSmall")
@@ -330,35 +998,68 @@ class MainWindow(QtWidgets.QMainWindow):
                 # Skip it, there's no image here
                 return
 
-        self.current_results.append(result)
-        self.add_result_item(result)
+        key = self.result_sort_key(result)
+        if at_end:
+            row = len(self.current_result_keys)
+        else:
+            row = bisect.bisect_right(self.current_result_keys, key)
+
+        self.current_result_keys.insert(row, key)
+        self.current_results.insert(row, result)
+        self.add_result_item(result, row)
 
-    def on_fetch_finished(self, results: list[Dict]):
+    def on_fetch_finished(self, generation: int, results: list[Dict]):
         """
-        When all of the results are loaded we sort them and display them in the UI
+        When all of the results are loaded we let the user know. The list is already sorted so nothing is rebuilt
 
+        :param generation: Generation of the fetch
         :param results: List of fetched records data
         """
+        if not self.is_current_generation(generation):
+            return
 
         self.progress_bar.hide()
-        self.current_results = results
-        self.populate_results()
-        self.statusBar().showMessage(f"Loaded {len(results)} objects", 3000)
+        self.statusBar().showMessage(
+            f"Loaded {len(self.current_results)} objects", 3000
+        )
+
+        if self.fetcher_thread is not None:
+            # Records that don't exist anymore have nothing to show either
+            for record_id in self.fetcher_thread.missing:
+                self.image_availability.mark_missing(record_id)
+
+        self.image_availability.save_index()
+        if self.has_images.isChecked():
+            self.update_classification_counts(r["objectID"] for r in results)
 
-    def on_fetch_error(self, error_message: str):
+        self.on_page_finished(generation)
+
+    def on_fetch_error(self, generation: int, error_message: str, rate_limited: bool):
         """
-        If we got an error while fetching (most likey rate limit) we warn the user and stop the thread.
+        If we got an error while fetching we stop the thread. The records of the page that weren't loaded are
+        paged again, so scrolling on tries them again. Only the rate limit is worth a warning, it means waiting
 
+        :param generation: Generation of the fetch
         :param error_message: The error message from the API module, at the moment we do not display it
+        :param rate_limited: If the API refused the request because of the rate limit
         """
+        if not self.is_current_generation(generation):
+            return
+
+        if self.fetcher_thread is not None:
+            self.page_offset = self.page_start + self.fetcher_thread.processed
 
         # Stop the thread
-        if self.fetcher_thread and self.fetcher_thread.isRunning():
-            self.fetcher_thread.stop()
-            self.fetcher_thread.wait(1000)
+        self.cancel_fetch()
 
         self.progress_bar.hide()
 
+        if not rate_limited:
+            self.statusBar().showMessage(
+                "Failed to load results, scroll down to try again", 5000
+            )
+            return
+
         QtWidgets.QMessageBox.warning(
             self,
             "Failed to load results",
@@ -368,28 +1069,51 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.statusBar().showMessage("Failed to load results...", 3000)
 
-    def add_result_item(self, result: Dict):
+    def add_result_item(self, result: Dict, row: Optional[int] = None):
         """
         Add a record to the results column
 
         :param result: Dictionary containing all of the record data
+        :param row: Row to insert the record at, by default it is added at the end
         """
 
-        item = QtWidgets.QListWidgetItem(self.results_list)
-        item_widget = ResultWidget(result)
+        item = QtWidgets.QListWidgetItem()
+        if row is None:
+            self.results_list.addItem(item)
+        else:
+            self.results_list.insertItem(row, item)
+
+        item_widget = ResultWidget(result, thumbnail_cache=self.thumbnail_cache)
         item.setSizeHint(item_widget.sizeHint())
         self.results_list.setItemWidget(item, item_widget)
         item.setData(QtCore.Qt.UserRole, result)
 
-    def populate_results(self):
+    def on_sort_changed(self):
+        """
+        Sort the results again. When the pages are in date order the whole selection is paged again in the new
+        order, the newly first records are usually not loaded yet
+        """
+        if self.pages_in_order and self.page_record_ids:
+            self.load_records(self.page_record_ids, self.page_classification)
+        else:
+            self.populate_results()
+
+    def populate_results(self, sort: bool = True):
         """
         Rebuild the results list in the results column. This is used instead of in place sorting
+
+        :param sort: Sort the results by date, off for results that are already in the order they are paged
         """
 
         self.results_list.clear()
-        sort_direction = self.sorting_combo.currentText()
-        sort_results = self.sort_results(sort_direction.lower())
+        self.results_list.setUpdatesEnabled(False)
+        if sort:
+            sort_direction = self.sorting_combo.currentText()
+            sort_results = self.sort_results(sort_direction.lower())
+        else:
+            sort_results = list(self.current_results)
 
+        self.current_results = []
         for result in sort_results:
             if self.has_images.isChecked():
                 image_url = result.get("primaryImageSmall")
@@ -398,9 +1122,14 @@ class MainWindow(QtWidgets.QMainWindow):
                     # Skip it, there's no image here
                     continue
 
+            self.current_results.append(result)
             self.add_result_item(result)
 
-        self.statusBar().showMessage(f"Loaded {len(sort_results)} results")
+        self.current_result_keys = [
+            self.result_sort_key(r) for r in self.current_results
+        ]
+        self.results_list.setUpdatesEnabled(True)
+        self.statusBar().showMessage(f"Loaded {len(self.current_results)} results")
 
     def sort_results(self, direction: str = "ascending") -> list[Dict]:
         """
@@ -415,16 +1144,91 @@ class MainWindow(QtWidgets.QMainWindow):
             reverse=direction != "ascending",
         )
 
+    def result_sort_key(self, result: Dict) -> int:
+        """
+        Sort key of a record for the current sort direction, so new records can be inserted in place with bisect
+
+        :param result: Record data
+        :returns: Key that increases down the results list
+        """
+        date = result.get("objectBeginDate", 0) or 0
+        if self.sorting_combo.currentText().lower() == "ascending":
+            return date
+
+        return -date
+
+    def on_result_selected(self, current, previous):
+        """
+        Show the selected record in the detail column
+
+        :param current: Current ListItemWidget selected in the UI
+        :param previous: Previous ListItemWidget selected in the UI (Not used)
+        """
+        if not current:
+            self.abandon_fetcher(self.similar_fetcher)
+            self.similar_fetcher = None
+            self.detail_view.clear()
+            return
+
+        self.show_detail(current.data(QtCore.Qt.UserRole))
+
+    def show_detail(self, record: Dict):
+        """
+        Show a record in the detail column with the records most like it
+
+        :param record: Record data
+        """
+        self.detail_view.show_record(record)
+        self.load_similar(record["objectID"])
+
+    def load_similar(self, record_id: int):
+        """
+        Fetch the records of the precomputed more like this list in the background, they are mostly in the
+        record store already so this is usually instant
+
+        :param record_id: ID of the record in the detail column
+        """
+        self.abandon_fetcher(self.similar_fetcher)
+        self.similar_fetcher = None
+
+        similar_ids = self.similarity_index.get_similar(record_id)
+        self.detail_view.set_similar_ids(similar_ids)
+        if not similar_ids:
+            return
+
+        self.similar_generation += 1
+        self.similar_fetcher = Fetcher(
+            self.met_api,
+            similar_ids,
+            generation=self.similar_generation,
+            store=self.record_store,
+            limiter=self.api_limiter,
+        )
+        self.similar_fetcher.results_ready.connect(self.on_similar_ready)
+        self.similar_fetcher.error.connect(
+            lambda generation, message, rate_limited: logger.warning(
+                f"Failed to load similar records: {message}"
+            )
+        )
+        self.similar_fetcher.start()
+
+    def on_similar_ready(self, generation: int, results: list[Dict]):
+        """
+        Add a batch of similar records to the detail column
+
+        :param generation: Generation of the similar records fetch
+        :param results: Batch of records data
+        """
+        if generation != self.similar_generation:
+            return
+
+        self.detail_view.add_similar(results)
+
     def on_has_images_toggle(self):
         """
         When we toggle the has_images checkbox we need to update the record count
         """
-        for i in range(self.classifications_list.count()):
-            item = self.classifications_list.item(i)
-            widget = self.classifications_list.itemWidget(item)
-
-            if widget:
-                widget.update_count()
+        self.update_all_classification_counts()
 
         current_classification = self.classifications_list.selectedItems()
         if current_classification:
@@ -434,6 +1238,244 @@ class MainWindow(QtWidgets.QMainWindow):
         # TODO: This re-fatches the records, we should use cache instead
         self.on_classification_item_selected(current_classification, None)
 
+    def update_all_classification_counts(self):
+        """
+        Refresh the count badge of every classification
+        """
+        for i in range(self.classifications_list.count()):
+            item = self.classifications_list.item(i)
+            widget = self.classifications_list.itemWidget(item)
+
+            if widget:
+                widget.update_count()
+
+    def save_session(self):
+        """
+        Save what the user is looking at, so the next launch can show it straight away
+        """
+        selected = self.classifications_list.selectedItems()
+        classification = None
+        if selected:
+            classification = self.classifications_list.itemWidget(
+                selected[0]
+            ).classification
+
+        self.session_store.save_session(
+            {
+                "classification": classification,
+                "search_text": self.search_field.text(),
+                "has_images": self.has_images.isChecked(),
+                "sort": self.sorting_combo.currentText(),
+                "date_range": self.date_histogram.selection,
+                "scroll": self.results_list.verticalScrollBar().value(),
+                "result_ids": [r["objectID"] for r in self.current_results],
+                "visits": dict(self.classification_visits),
+            }
+        )
+
+    def restore_session(self):
+        """
+        Show the last session straight from the local record and thumbnail caches, without waiting for the
+        network. The records are revalidated against the API in the background afterwards
+        """
+        session = self.session_store.load_session()
+        if not session:
+            return
+
+        self.classification_visits = Counter(session.get("visits", {}))
+        self.visited_classification = session.get("classification")
+
+        # Restore the controls without triggering their fetches
+        controls = (self.has_images, self.sorting_combo, self.classifications_list)
+        for control in controls:
+            control.blockSignals(True)
+
+        try:
+            self.search_field.setText(session.get("search_text", ""))
+            self.has_images.setChecked(session.get("has_images", False))
+            self.sorting_combo.setCurrentText(session.get("sort", "Ascending"))
+            self.update_all_classification_counts()
+
+            widget = self.classification_widgets.get(session.get("classification"))
+            if widget is None:
+                return
+
+            for i in range(self.classifications_list.count()):
+                item = self.classifications_list.item(i)
+                if self.classifications_list.itemWidget(item) is widget:
+                    self.classifications_list.setCurrentItem(item)
+                    self.classifications_list.scrollToItem(item)
+                    break
+
+            self.date_histogram.set_dates(self.date_index.get(widget.classification))
+            if session.get("date_range"):
+                self.date_histogram.set_selection(*session["date_range"])
+        finally:
+            for control in controls:
+                control.blockSignals(False)
+
+        result_ids = session.get("result_ids", [])
+        stored = self.record_store.get_many(result_ids)
+        if not stored:
+            # Nothing cached, this is just a normal fetch
+            self.load_records(
+                self.selected_record_ids(widget), widget.classification
+            )
+            return
+
+        # Scrolling on continues with the records that aren't shown yet. The order is rebuilt from the current
+        # indexes, so it may differ from the last session's and an offset into it would skip or repeat records
+        self.set_pages(self.selected_record_ids(widget), widget.classification)
+
+        # Records that were paged in order were saved in that order, sorting them would undo e.g. verified first
+        self.current_results = [stored[r] for r in result_ids if r in stored]
+        self.populate_results(sort=not self.pages_in_order)
+
+        shown = set(result_ids)
+        self.page_record_ids = result_ids + [
+            r for r in self.page_record_ids if r not in shown
+        ]
+        self.page_offset = len(result_ids)
+
+        scroll = session.get("scroll", 0)
+        QtCore.QTimer.singleShot(
+            0, lambda: self.results_list.verticalScrollBar().setValue(scroll)
+        )
+
+        self.revalidate_records(result_ids)
+
+    def revalidate_records(self, record_ids: list[int]):
+        """
+        Refetch the shown records from the API in the background and update the ones that changed in place
+
+        :param record_ids: IDs of the records to revalidate
+        """
+        self.cancel_fetch()
+
+        self.fetch_generation += 1
+        self.fetcher_thread = Fetcher(
+            self.met_api,
+            record_ids,
+            generation=self.fetch_generation,
+            store=self.record_store,
+            refresh=True,
+            limiter=self.api_limiter,
+            page_sizer=self.page_sizer,
+        )
+        # Scrolling waits for the revalidation instead of abandoning it
+        self.page_pending = True
+        self.fetcher_thread.results_ready.connect(self.on_results_revalidated)
+        self.fetcher_thread.fetch_finished.connect(
+            lambda generation, results: self.on_page_finished(generation)
+        )
+        self.fetcher_thread.error.connect(self.on_revalidation_error)
+        self.fetcher_thread.start()
+
+    def on_revalidation_error(
+        self, generation: int, error_message: str, rate_limited: bool
+    ):
+        """
+        Revalidating is best effort, the stored records stay on screen
+
+        :param generation: Generation of the fetch
+        :param error_message: The error message from the API module
+        :param rate_limited: If the API refused the request because of the rate limit (not used)
+        """
+        logger.warning(f"Failed to revalidate records: {error_message}")
+        self.on_page_finished(generation)
+
+    def on_results_revalidated(self, generation: int, results: list[Dict]):
+        """
+        Update the records that changed since they were stored and add the ones that weren't stored at all. A
+        changed record is taken out and inserted again, its date (and so its position) may have changed too
+
+        :param generation: Generation of the fetch
+        :param results: Batch of fresh records data from the API
+        """
+        if not self.is_current_generation(generation):
+            return
+
+        fresh = {r["objectID"]: r for r in results}
+        changed_rows = []
+
+        for row in range(self.results_list.count()):
+            old = self.results_list.item(row).data(QtCore.Qt.UserRole)
+            new = fresh.pop(old["objectID"], None)
+
+            if new is not None and new != old:
+                changed_rows.append(row)
+                fresh[new["objectID"]] = new
+
+        self.results_list.setUpdatesEnabled(False)
+
+        # Back to front, so the rows still to remove keep their position
+        for row in reversed(changed_rows):
+            self.results_list.takeItem(row)
+            del self.current_results[row]
+            del self.current_result_keys[row]
+
+        # The changed records and the ones that were missing from the store
+        for result in fresh.values():
+            self.insert_result(result)
+
+        self.results_list.setUpdatesEnabled(True)
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        """
+        Save the session and give running threads a moment to abort their requests so no thread is destroyed
+        while running
+
+        :param event: Close event
+        """
+        self.save_session()
+        self.cancel_fetch()
+        self.abandon_fetcher(self.similar_fetcher)
+        self.detail_view.shutdown()
+        self.image_verifier.stop()
+        self.maintenance.stop()
+        self.memory_monitor.stop()
+        threads = [
+            self.image_verifier,
+            self.maintenance,
+            self.memory_monitor,
+            *self.abandoned_fetchers,
+        ]
+
+        if self.exporter_thread:
+            self.exporter_thread.stop()
+            threads.append(self.exporter_thread)
+
+        for thread in threads:
+            thread.wait(2000)
+
+        self.image_availability.save_index()
+
+        super().closeEvent(event)
+
+    def on_records_verified(self, record_ids: list[int]):
+        """
+        Update the count badges of the classifications the verified records belong to
+
+        :param record_ids: IDs of the records that were just verified
+        """
+        if self.has_images.isChecked():
+            self.update_classification_counts(record_ids)
+
+    def update_classification_counts(self, record_ids):
+        """
+        Refresh the count badges of the classifications that contain any of the given records
+
+        :param record_ids: Record IDs that changed
+        """
+        classifications = {
+            self.local_api.get_record_classification(r) for r in record_ids
+        }
+
+        for classification in classifications:
+            widget = self.classification_widgets.get(classification)
+            if widget:
+                widget.update_count()
+
     def filter_classifications(self, search_text: str):
         """
         Filters the classification list based on th search text
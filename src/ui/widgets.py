@@ -1,6 +1,8 @@
 from typing import Dict, Optional
 from PySide6 import QtGui, QtWidgets, QtCore
-import requests
+from src.api.date_index import ClassificationDates
+from src.api.thumbnail_cache import THUMBNAIL_SIZE, ThumbnailCache
+from src.ui.worker import ImageLoader
 
 
 class Image(QtWidgets.QLabel):
@@ -8,9 +10,16 @@ class Image(QtWidgets.QLabel):
     Display an image in the UI
     """
 
-    def __init__(self, size=(200, 200), public_domain=False, parent=None):
+    def __init__(
+        self,
+        size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE),
+        public_domain=False,
+        thumbnail_cache: Optional[ThumbnailCache] = None,
+        parent=None,
+    ):
         super().__init__(parent=parent)
         self.public_domain = public_domain
+        self.thumbnail_cache = thumbnail_cache or ThumbnailCache()
         self.setFixedSize(*size)
         self.setAlignment(QtCore.Qt.AlignCenter)
         self.setScaledContents(False)
@@ -21,7 +30,8 @@ class Image(QtWidgets.QLabel):
 
     def load_image_from_url(self, image_url: str) -> None:
         """
-        Load an image into the label
+        Load an image into the label. Downloading and decoding happens on a pool thread, the label is updated
+        once the thumbnail is ready
 
         :param image_url: Url of image to load
         """
@@ -33,26 +43,35 @@ class Image(QtWidgets.QLabel):
             self.setText("No Image")
             return
 
-        try:
-            response = requests.get(image_url, timeout=10)
-            response.raise_for_status()
-
-            pixmap = QtGui.QPixmap()
-            pixmap.loadFromData(response.content)
+        dpr = self.devicePixelRatioF()
+        image = self.thumbnail_cache.cached(
+            image_url, round(self.width() * dpr), round(self.height() * dpr)
+        )
+        if image is not None:
+            # Recently shown, no need to go through a worker
+            image.setDevicePixelRatio(dpr)
+            self.on_image_loaded(image)
+            return
 
-            if pixmap.isNull():
-                self.setText("Invalid Image")
-                return
+        loader = ImageLoader(
+            image_url,
+            self.width(),
+            self.height(),
+            dpr,
+            self.thumbnail_cache,
+        )
+        loader.signals.loaded.connect(self.on_image_loaded)
+        loader.signals.failed.connect(self.setText)
+        QtCore.QThreadPool.globalInstance().start(loader)
 
-            scaled_pixmap = pixmap.scaled(
-                self.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation
-            )
+    @QtCore.Slot(QtGui.QImage)
+    def on_image_loaded(self, image: QtGui.QImage):
+        """
+        Display a decoded thumbnail, it is already at the right size so no scaling is needed
 
-            # We have an image style and set propery
-            self.setPixmap(scaled_pixmap)
-        except Exception as e:
-            self.setText("Error Loading Image")
-            print(f"Error: Failed to load image {str(e)}")
+        :param image: Decoded and downscaled image
+        """
+        self.setPixmap(QtGui.QPixmap.fromImage(image))
 
 
 class ResultWidget(QtWidgets.QWidget):
@@ -60,15 +79,22 @@ class ResultWidget(QtWidgets.QWidget):
     UI for a single record, shows title, artist, medium, department and work creation date
     """
 
-    def __init__(self, data: Dict, parent: Optional[QtWidgets.QWidget] = None):
+    def __init__(
+        self,
+        data: Dict,
+        thumbnail_cache: Optional[ThumbnailCache] = None,
+        parent: Optional[QtWidgets.QWidget] = None,
+    ):
         """
         Initialize the widget
 
         :param data: Dictionary of record data
+        :param thumbnail_cache: Shared disk cache for thumbnails
         :param parent: Parent widget
         """
         super().__init__(parent=parent)
         self.data = data
+        self.thumbnail_cache = thumbnail_cache
         self.is_public_domain = self.data.get("isPublicDomain", False)
         self.setup_ui()
         self.setStyleSheet("""
@@ -88,7 +114,10 @@ class ResultWidget(QtWidgets.QWidget):
         self.setLayout(main_layout)
 
         # Left column (Image)
-        image = Image(public_domain=self.data.get("isPublicDomain"))
+        image = Image(
+            public_domain=self.data.get("isPublicDomain"),
+            thumbnail_cache=self.thumbnail_cache,
+        )
         image.load_image_from_url(self.data.get("primaryImageSmall"))
         main_layout.addWidget(image)
 
@@ -173,18 +202,46 @@ class ClassificationWidget(QtWidgets.QWidget):
         """
         Number of records in the category (changes if we has_images is selected)
         """
-        return len(self.filtered_record_ids)
+        if self.main_window.has_images.isChecked():
+            verified, unverified = self.image_record_ids()
+            return len(verified) + len(unverified)
+
+        return len(self.record_ids)
 
     @property
     def filtered_record_ids(self):
         """
-        Records in the category filtered if has_images is selected
+        Records in the category filtered if has_images is selected. Records verified to have a displayable image
+        come first, so a page only contains records that might not be shown once everything verified runs out
         """
         if self.main_window.has_images.isChecked():
-            return list(self.main_window.records_with_images & self.record_ids)
+            verified, unverified = self.image_record_ids()
+            return sorted(verified) + sorted(unverified)
         else:
             return list(self.record_ids)
 
+    def image_record_ids(self) -> tuple[set, set]:
+        """
+        Split the records in the category that might have an image into verified and not yet verified ones. Records
+        the API marks as having images are candidates until the verifier says otherwise
+
+        :returns: Verified displayable records and unverified candidates
+        """
+        availability = self.main_window.image_availability
+        query_cache = self.main_window.query_cache
+
+        # One entry per classification, replaced once verifications made it stale. The main window clears the
+        # cache when it loads another image cache
+        entry = query_cache.get(self.classification)
+        if entry is not None and entry[0] == availability.version:
+            return entry[1]
+
+        result = availability.split_image_records(
+            self.record_ids, self.main_window.records_with_images
+        )
+        query_cache.put(self.classification, (availability.version, result))
+        return result
+
     def setup_ui(self):
         main_layout = QtWidgets.QHBoxLayout()
         main_layout.setContentsMargins(8, 4, 8, 4)
@@ -223,7 +280,149 @@ class ClassificationWidget(QtWidgets.QWidget):
         Update the UI with the current record count
         """
         if self.main_window.has_images.isChecked():
-            self.count_label.setText(f"~{self.count}")
-            self.count_label.setToolTip("API approximation - some items maybe exluded")
+            verified, unverified = self.image_record_ids()
+            count = len(verified) + len(unverified)
+
+            if unverified:
+                self.count_label.setText(f"~{count}")
+                self.count_label.setToolTip(
+                    f"{len(verified)} verified, {len(unverified)} still being checked"
+                )
+            else:
+                self.count_label.setText(str(count))
+                self.count_label.setToolTip("Verified")
         else:
             self.count_label.setText(str(self.count))
+            self.count_label.setToolTip("")
+
+
+class DateHistogram(QtWidgets.QWidget):
+    """
+    Distribution of a classification's records over time. Dragging over the bars selects a range of dates,
+    a double click selects everything again
+    """
+
+    # First bin and the bin after the last one
+    range_selected = QtCore.Signal(int, int)
+    selection_cleared = QtCore.Signal()
+
+    def __init__(self, parent: Optional[QtWidgets.QWidget] = None):
+        super().__init__(parent=parent)
+        self.dates = None
+        self.counts = []
+        self.selection = None
+        self.drag_start = None
+        self.setMinimumHeight(70)
+        self.setMouseTracking(True)
+        self.setCursor(QtCore.Qt.CrossCursor)
+
+    def set_dates(self, dates: Optional[ClassificationDates]):
+        """
+        Show the histogram of a classification, this clears the selection unless it's the same classification
+
+        :param dates: Dates of the classification, None hides the histogram
+        """
+        if dates is self.dates:
+            return
+
+        self.dates = dates
+        self.counts = dates.bin_counts() if dates is not None else []
+        self.selection = None
+        self.drag_start = None
+        self.setVisible(dates is not None)
+        self.update()
+
+    def set_selection(self, start: int, end: int):
+        """
+        Select a range of bins without emitting anything, used to restore a session
+
+        :param start: First bin
+        :param end: Bin after the last one
+        """
+        if self.dates is None or not 0 <= start < end <= self.dates.bin_count:
+            return
+
+        self.selection = (start, end)
+        self.update()
+
+    def bin_at(self, x: float) -> int:
+        """
+        Get the bin under a position
+        """
+        index = int(x * len(self.counts) / max(self.width(), 1))
+        return min(max(index, 0), len(self.counts) - 1)
+
+    def paintEvent(self, event: QtGui.QPaintEvent):
+        if not self.counts:
+            return
+
+        painter = QtGui.QPainter(self)
+        font = painter.font()
+        font.setPointSize(9)
+        painter.setFont(font)
+
+        label_height = painter.fontMetrics().height()
+        chart_height = self.height() - label_height - 2
+        bar_width = self.width() / len(self.counts)
+        highest = max(self.counts) or 1
+
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+
+            selected = self.selection is None or (
+                self.selection[0] <= index < self.selection[1]
+            )
+            height = max(1, round(chart_height * count / highest))
+            painter.fillRect(
+                QtCore.QRectF(
+                    index * bar_width,
+                    chart_height - height,
+                    max(bar_width - 1, 1),
+                    height,
+                ),
+                QtGui.QColor("#0066cc" if selected else "#c8c8c8"),
+            )
+
+        painter.setPen(QtGui.QColor("#666"))
+        start, end = self.selection or (0, len(self.counts))
+        painter.drawText(
+            QtCore.QRectF(0, chart_height + 2, self.width(), label_height),
+            QtCore.Qt.AlignCenter,
+            self.dates.bin_label(start, end),
+        )
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent):
+        if event.button() == QtCore.Qt.LeftButton and self.counts:
+            self.drag_start = self.bin_at(event.position().x())
+            self.selection = (self.drag_start, self.drag_start + 1)
+            self.update()
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent):
+        if not self.counts:
+            return
+
+        index = self.bin_at(event.position().x())
+        if self.drag_start is not None:
+            self.selection = (
+                min(self.drag_start, index),
+                max(self.drag_start, index) + 1,
+            )
+            self.update()
+
+        QtWidgets.QToolTip.showText(
+            event.globalPosition().toPoint(),
+            f"{self.dates.bin_label(index, index + 1)}: {self.counts[index]:,} objects",
+            self,
+        )
+
+    def mouseReleaseEvent(self, event: QtGui.QMouseEvent):
+        if event.button() == QtCore.Qt.LeftButton and self.drag_start is not None:
+            self.drag_start = None
+            self.range_selected.emit(*self.selection)
+
+    def mouseDoubleClickEvent(self, event: QtGui.QMouseEvent):
+        self.drag_start = None
+        self.selection = None
+        self.update()
+        self.selection_cleared.emit()
@@ -1,27 +1,151 @@
-from PySide6.QtCore import QThread, Signal
+from PySide6.QtCore import QObject, QRunnable, QThread, Signal
+from PySide6.QtGui import QImage
 from loguru import logger
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from src.api.exporter import export_records
+from src.api.id_set import IdSet
+from src.api.memory_budget import LOW_MEMORY_BYTES, available_system_memory
+from src.api.met_api import (
+    IMAGE_SEARCH_LETTERS,
+    RATE_LIMIT_PAUSE,
+    RateLimitedError,
+    RecordNotFoundError,
+    RequestCancelled,
+)
+from src.api.thumbnail_cache import THUMBNAIL_SIZE, ThumbnailCache, decode_scaled
+
+# Seconds the image verifier waits before trying again after a failed request that wasn't rate limited
+VERIFY_RETRY_DELAY = 10
+# Minimum time between two deliveries to the UI, about one frame at 60Hz
+FRAME_INTERVAL = 1 / 60
+# Stored records older than this are revalidated when the app is idle
+STALE_RECORD_AGE = timedelta(days=30)
+# Stale records revalidated per maintenance round
+STALE_RECORDS_PER_ROUND = 200
+# The image cache is searched again once it is older than this
+IMAGE_CACHE_AGE = timedelta(days=7)
+# Rest between maintenance rounds, in seconds
+MAINTENANCE_INTERVAL = 15 * 60
+# Largest width or height an image is decoded at for the actual size view, in pixels (about 100 MB decoded)
+ACTUAL_SIZE_LIMIT = 5000
+# Seconds between two samples of the available system memory
+MEMORY_CHECK_INTERVAL = 5
 
 
 class Fetcher(QThread):
     """
-    Thread to access API without blocking UI
+    Thread to access API without blocking UI. Every signal carries the generation the fetch was started for, so
+    the UI can drop late results from a selection that is no longer current.
+
+    Results and progress are batched and emitted at most once per frame interval, so the UI does layout work per
+    batch instead of per record. Records that don't exist anymore are skipped, any other error ends the fetch
     """
 
-    # Progress has three variables: current, total, message
-    progress = Signal(int, int, str)
-    result_ready = Signal(dict)
-    finished = Signal(list)
-    error = Signal(str)
+    # Progress has four variables: generation, current, total, message
+    progress = Signal(int, int, int, str)
+    results_ready = Signal(int, list)
+    fetch_finished = Signal(int, list)
+    # Error has three variables: generation, message and if it was the rate limit
+    error = Signal(int, str, bool)
 
-    def __init__(self, api, record_ids):
+    def __init__(
+        self,
+        api,
+        record_ids,
+        generation=0,
+        store=None,
+        refresh=False,
+        limiter=None,
+        page_sizer=None,
+    ):
+        """
+        :param api: MetAPI instance
+        :param record_ids: IDs of the records to fetch
+        :param generation: Generation the results are tagged with
+        :param store: Optional record store that is read before going to the API
+        :param refresh: Always fetch from the API (and update the store), used to revalidate stored records
+        :param limiter: Optional RateLimiter shared by everything that makes API requests, paused when the API says
+            we went over the limit
+        :param page_sizer: Optional PageSizer that is told how long every request took
+        """
         super().__init__()
         self.api = api
+        self.store = store
+        self.refresh = refresh
+        self.limiter = limiter
+        self.page_sizer = page_sizer
         self.record_ids = record_ids
+        self.generation = generation
         self.results = []
-        self._stop = False
+        # IDs of the records that don't exist anymore
+        self.missing = []
+        # Number of records that are done, delivered or missing. On an error the fetch can continue from here
+        self.processed = 0
+        self._batch = []
+        self._last_flush = 0.0
+        self._cancel = threading.Event()
 
     def stop(self):
-        self._stop = True
+        """
+        Ask the thread to stop, this also aborts the request currently in flight. It does not wait for the thread
+        """
+        self._cancel.set()
+
+    def flush(self, current: int, total: int):
+        """
+        Send the batched results and the latest progress to the UI
+
+        :param current: Number of records processed so far
+        :param total: Total records to process
+        """
+        self.progress.emit(
+            self.generation, current, total, f"Loading {current}/{total}..."
+        )
+
+        if self._batch:
+            self.results_ready.emit(self.generation, self._batch)
+            self._batch = []
+
+        self._last_flush = time.monotonic()
+
+    def fetch(self, record_id: int) -> dict:
+        """
+        Fetch a record from the API. Unless we are refreshing, a record another thread or app instance is fetching
+        right now is taken from the store once it's there
+        """
+
+        def request():
+            if self.limiter is not None and not self.limiter.acquire(self._cancel):
+                raise RequestCancelled(f"Request for record {record_id} cancelled")
+
+            start = time.monotonic()
+            try:
+                record = self.api.get_single_record(
+                    record_id, cancel_event=self._cancel
+                )
+            except RateLimitedError:
+                if self.limiter is not None:
+                    self.limiter.pause(RATE_LIMIT_PAUSE)
+                raise
+
+            if self.page_sizer is not None:
+                # Only requests that went to the network, store hits would make the link look faster than it is
+                self.page_sizer.record_latency(time.monotonic() - start)
+
+            return record
+
+        if self.store is None:
+            return request()
+
+        if self.refresh:
+            result = request()
+            self.store.put(result)
+            return result
+
+        return self.store.get_or_fetch(record_id, request, cancel_event=self._cancel)
 
     def run(self):
         """
@@ -30,21 +154,797 @@ class Fetcher(QThread):
         total = len(self.record_ids)
         try:
             for i, record_id in enumerate(self.record_ids):
-                self.progress.emit(i + 1, total, f"Loading {i + 1}/{total}...")
-
-                if self._stop:
+                if self._cancel.is_set():
                     logger.info("Fetch cancelled")
                     return
 
-                result = self.api.get_single_record(record_id)
+                result = None
+                if self.store and not self.refresh:
+                    result = self.store.get(record_id)
+
+                if result is None:
+                    # We are about to block on the network, don't leave a batch waiting for that long
+                    if self._batch:
+                        elapsed = time.monotonic() - self._last_flush
+                        remaining = FRAME_INTERVAL - elapsed
+                        if remaining > 0:
+                            self._cancel.wait(remaining)
+
+                        self.flush(i, total)
+
+                    try:
+                        result = self.fetch(record_id)
+                    except RecordNotFoundError:
+                        logger.warning(
+                            f"Skipping record {record_id}, it does not exist"
+                        )
+                        self.missing.append(record_id)
 
                 if result:
                     self.results.append(result)
-                    self.result_ready.emit(result)
+                    self._batch.append(result)
 
-            if not self._stop:
-                self.finished.emit(self.results)
+                self.processed = i + 1
+                if time.monotonic() - self._last_flush >= FRAME_INTERVAL:
+                    self.flush(i + 1, total)
+
+            if not self._cancel.is_set():
+                self.flush(total, total)
+                self.fetch_finished.emit(self.generation, self.results)
+
+        except RequestCancelled:
+            logger.info("Fetch cancelled")
 
         except ConnectionError as e:
             logger.error(f"Error fatching records: {e}")
+            # Deliver what we have, processed counts these records as done
+            self.flush(self.processed, total)
+            self.error.emit(
+                self.generation, str(e), isinstance(e, RateLimitedError)
+            )
+
+
+class Exporter(QThread):
+    """
+    Thread to export records to a file without blocking the UI
+    """
+
+    # Progress has three variables: current, total, message
+    progress = Signal(int, int, str)
+    export_finished = Signal(int, str)
+    error = Signal(str)
+
+    def __init__(
+        self,
+        api,
+        store,
+        record_ids,
+        path,
+        export_format=None,
+        limiter=None,
+        image_availability=None,
+    ):
+        """
+        :param api: MetAPI instance
+        :param store: Record store that is read before going to the API
+        :param record_ids: IDs of the records to export
+        :param path: Output file
+        :param export_format: One of jsonl, csv or parquet, taken from the file extension by default
+        :param limiter: RateLimiter for the records that have to come from the API
+        :param image_availability: When given, records that turn out to have no displayable image are left out
+        """
+        super().__init__()
+        self.api = api
+        self.store = store
+        self.record_ids = record_ids
+        self.path = path
+        self.export_format = export_format
+        self.limiter = limiter
+        self.image_availability = image_availability
+        self._last_progress = 0.0
+        self._cancel = threading.Event()
+
+    def stop(self):
+        """
+        Ask the thread to stop, it does not wait for the thread
+        """
+        self._cancel.set()
+
+    def on_progress(self, current: int, total: int):
+        """
+        Report export progress, throttled to one update per frame
+        """
+        now = time.monotonic()
+        if now - self._last_progress >= FRAME_INTERVAL or current == total:
+            self.progress.emit(current, total, f"Exporting {current}/{total}...")
+            self._last_progress = now
+
+    def run(self):
+        """
+        Stream the records into the file
+        """
+        try:
+            written = export_records(
+                self.record_ids,
+                self.path,
+                export_format=self.export_format,
+                store=self.store,
+                api=self.api,
+                limiter=self.limiter,
+                image_availability=self.image_availability,
+                progress_callback=self.on_progress,
+                cancel_event=self._cancel,
+            )
+
+            if not self._cancel.is_set():
+                self.export_finished.emit(written, str(self.path))
+
+        except RequestCancelled:
+            logger.info("Export cancelled")
+
+        except Exception as e:
+            logger.error(f"Export failed: {e}")
             self.error.emit(str(e))
+
+
+class ImageVerifier(QThread):
+    """
+    Background thread that checks records against the record store or the API to find out if they really have a
+    displayable image. It runs for the lifetime of the app and waits for work to be queued
+    """
+
+    # Record IDs verified since the last emit
+    verified = Signal(list)
+
+    def __init__(self, api, store, availability, limiter):
+        super().__init__()
+        self.api = api
+        self.store = store
+        self.availability = availability
+        self.limiter = limiter
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._cancel = threading.Event()
+
+    def queue(self, record_ids, priority=False):
+        """
+        Add records to verify
+
+        :param record_ids: Record IDs to verify, already verified ones are skipped
+        :param priority: Verify these before anything that is already queued
+        """
+        record_ids = sorted(self.availability.unverified_in(record_ids))
+
+        with self._condition:
+            if priority:
+                self._queue.extendleft(reversed(record_ids))
+            else:
+                self._queue.extend(record_ids)
+
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Ask the thread to stop, it does not wait for the thread
+        """
+        self._cancel.set()
+        with self._condition:
+            self._condition.notify()
+
+    def next_record_id(self):
+        """
+        Wait for the next record that still needs verifying
+        :returns: Record ID or None if we were stopped
+        """
+        with self._condition:
+            while not self._cancel.is_set():
+                while self._queue:
+                    record_id = self._queue.popleft()
+                    # It might have been verified by a fetch since it was queued
+                    if not self.availability.is_verified(record_id):
+                        return record_id
+
+                self._condition.wait()
+
+        return None
+
+    def verify(self, record_id: int):
+        """
+        Verify a single record, the store is checked before going to the API
+        """
+        record = self.store.get(record_id)
+
+        if record is None:
+            if not self.limiter.acquire(self._cancel):
+                raise RequestCancelled(f"Verification of {record_id} cancelled")
+
+            try:
+                record = self.store.get_or_fetch(
+                    record_id,
+                    lambda: self.api.get_single_record(
+                        record_id, cancel_event=self._cancel
+                    ),
+                    cancel_event=self._cancel,
+                )
+            except RecordNotFoundError:
+                self.availability.mark_missing(record_id)
+                return
+
+        self.availability.update_from_record(record)
+
+    def run(self):
+        """
+        Verify queued records in the background, the index is saved every few hundred records
+        """
+        batch = []
+        last_emit = time.monotonic()
+        since_save = 0
+
+        while True:
+            record_id = self.next_record_id()
+            if record_id is None:
+                break
+
+            try:
+                self.verify(record_id)
+            except RequestCancelled:
+                break
+            except ConnectionError as e:
+                logger.warning(f"Verification paused, {e}")
+                with self._condition:
+                    self._queue.appendleft(record_id)
+
+                if isinstance(e, RateLimitedError):
+                    # Pauses every request of the app, the limit is for all of them
+                    self.limiter.pause(RATE_LIMIT_PAUSE)
+                elif self._cancel.wait(VERIFY_RETRY_DELAY):
+                    break
+
+                continue
+            except Exception as e:
+                # A broken record or a busy database only costs this record, not the thread
+                logger.exception(f"Failed to verify record {record_id}: {e}")
+                continue
+
+            batch.append(record_id)
+            since_save += 1
+
+            if not self._queue or time.monotonic() - last_emit >= FRAME_INTERVAL:
+                self.verified.emit(batch)
+                batch = []
+                last_emit = time.monotonic()
+
+            if since_save >= 200:
+                self.availability.save_index()
+                since_save = 0
+
+        self.availability.save_index()
+
+
+class MaintenanceWorker(QThread):
+    """
+    Background thread that keeps the local caches fresh while the app is idle: it pre-warms the most visited
+    classifications, verifies their images, refreshes the image cache a letter at a time, revalidates stale records
+    and keeps the disk caches in budget.
+
+    The UI resumes it once the user is idle and nothing else uses the network, and pauses it on any interaction.
+    Pausing aborts the request in flight, the work continues where it stopped on the next resume
+    """
+
+    # Name of the task that is running
+    task_started = Signal(str)
+    # Record IDs whose image availability was verified
+    verified = Signal(list)
+    # The image cache was rewritten and should be reloaded
+    image_cache_refreshed = Signal()
+
+    def __init__(
+        self,
+        api,
+        store,
+        thumbnail_cache,
+        availability,
+        image_cache,
+        limiter,
+        device_pixel_ratio=1.0,
+    ):
+        """
+        :param api: MetAPI instance
+        :param store: Record store
+        :param thumbnail_cache: Thumbnail cache, pre-warmed and kept in its disk budget
+        :param availability: Image availability index
+        :param image_cache: Image record cache, refreshed once it gets old
+        :param limiter: RateLimiter for all maintenance requests
+        :param device_pixel_ratio: Pixel ratio the thumbnails are pre-warmed for
+        """
+        super().__init__()
+        self.api = api
+        self.store = store
+        self.thumbnail_cache = thumbnail_cache
+        self.availability = availability
+        self.image_cache = image_cache
+        self.limiter = limiter
+        self.device_pixel_ratio = device_pixel_ratio
+        self._lock = threading.Lock()
+        # Pages of the most visited classifications and their records that still need verifying
+        self._warm_pages = []
+        self._unverified = []
+        # Image cache search in progress: the letters still to search and the records found so far
+        self._image_search = None
+        # Set while the app is idle
+        self._idle = threading.Event()
+        # Set on interaction, aborts the request in flight
+        self._interrupt = threading.Event()
+        self._cancel = threading.Event()
+
+    def set_targets(self, warm_pages: list[list[int]], unverified: list[int]):
+        """
+        Tell the worker what the user looks at most
+
+        :param warm_pages: First page of record IDs of the most visited classifications, most visited first
+        :param unverified: Records of those classifications that still need verifying
+        """
+        with self._lock:
+            self._warm_pages = warm_pages
+            self._unverified = unverified
+
+    @property
+    def paused(self) -> bool:
+        return not self._idle.is_set()
+
+    def resume(self):
+        """
+        The app is idle, maintenance may run
+        """
+        self._interrupt.clear()
+        self._idle.set()
+
+    def pause(self):
+        """
+        The user is doing something, stop as soon as possible. Cheap enough to call on every input event
+        """
+        # Once stopped the thread has to be able to run to its end
+        if self._idle.is_set() and not self._cancel.is_set():
+            self._idle.clear()
+            self._interrupt.set()
+
+    def stop(self):
+        """
+        Ask the thread to stop, it does not wait for the thread
+        """
+        self._cancel.set()
+        self._interrupt.set()
+        self._idle.set()
+
+    def wait_until_idle(self) -> bool:
+        """
+        Block while maintenance is paused
+
+        :returns: False if the worker was stopped
+        """
+        self._idle.wait()
+        return not self._cancel.is_set()
+
+    def fetch_record(self, record_id: int, refresh: bool = False) -> dict:
+        """
+        Fetch a record from the API and store it, waiting out any pause. A request aborted by a pause is made again
+        once the app is idle. A pause aborts the request, so the record's lock is never held while paused
+
+        :param record_id: ID of the record
+        :param refresh: Fetch it even if it is stored, to revalidate it
+        :returns: Record data
+        """
+
+        def request():
+            return self.api.get_single_record(record_id, cancel_event=self._interrupt)
+
+        while True:
+            if not self.wait_until_idle():
+                raise RequestCancelled("Maintenance stopped")
+
+            if not self.limiter.acquire(self._interrupt):
+                continue
+
+            try:
+                if not refresh:
+                    return self.store.get_or_fetch(
+                        record_id, request, cancel_event=self._interrupt
+                    )
+
+                record = request()
+                self.store.put(record)
+                return record
+            except RequestCancelled:
+                if self._cancel.is_set():
+                    raise
+
+    def tasks(self):
+        """
+        The maintenance tasks in the order they run, the ones the user notices most first
+        """
+        return [
+            ("Pre-warming classifications", self.prewarm),
+            ("Verifying images", self.verify_images),
+            ("Refreshing image cache", self.refresh_image_cache),
+            ("Revalidating records", self.revalidate_records),
+            ("Cleaning up caches", self.clean_up),
+        ]
+
+    def prewarm(self):
+        """
+        Store the records and thumbnails of the first page of the most visited classifications, so they open
+        without touching the network
+        """
+        with self._lock:
+            pages = list(self._warm_pages)
+
+        size = round(THUMBNAIL_SIZE * self.device_pixel_ratio)
+        for page in pages:
+            for record_id in page:
+                record = self.store.get(record_id)
+                if record is None:
+                    try:
+                        record = self.fetch_record(record_id)
+                    except RecordNotFoundError:
+                        continue
+
+                self.availability.update_from_record(record)
+
+                image_url = record.get("primaryImageSmall")
+                if image_url:
+                    try:
+                        # Only downloads if the thumbnail is not cached yet
+                        self.thumbnail_cache.fetch(
+                            image_url, size, size, cancel_event=self._interrupt
+                        )
+                    except RequestCancelled:
+                        # Paused, it's made on the next round
+                        pass
+                    except Exception as e:
+                        logger.warning(f"Failed to pre-warm image {image_url}: {e}")
+
+                yield
+
+    def verify_images(self):
+        """
+        Verify the images of the most visited classifications
+        """
+        with self._lock:
+            record_ids = list(self._unverified)
+
+        batch = []
+        for record_id in record_ids:
+            if self.availability.is_verified(record_id):
+                continue
+
+            record = self.store.get(record_id)
+            if record is None:
+                if batch:
+                    # Don't keep the badges waiting on the network
+                    self.verified.emit(batch)
+                    batch = []
+
+                try:
+                    record = self.fetch_record(record_id)
+                except RecordNotFoundError:
+                    self.availability.mark_missing(record_id)
+                    continue
+
+            self.availability.update_from_record(record)
+            batch.append(record_id)
+            yield
+
+        if batch:
+            self.verified.emit(batch)
+
+    def refresh_image_cache(self):
+        """
+        Search the records with images again once the cache is old, a letter at a time instead of the whole
+        alphabet in one go
+        """
+        if self._image_search is None:
+            updated_on = self.image_cache.updated_on()
+            if updated_on is not None and datetime.now() - updated_on < IMAGE_CACHE_AGE:
+                return
+
+            self._image_search = (list(IMAGE_SEARCH_LETTERS), IdSet())
+
+        letters, found = self._image_search
+        while letters:
+            if not self.wait_until_idle():
+                return
+
+            if not self.limiter.acquire(self._interrupt):
+                continue
+
+            try:
+                found = found | self.api.search(
+                    letters[0], has_images=True, cancel_event=self._interrupt
+                )
+            except RequestCancelled:
+                # Paused half way, the letter is searched again once the app is idle
+                continue
+
+            letters.pop(0)
+            self._image_search = (letters, found)
+            yield
+
+        self.image_cache.write_cache(found)
+        self._image_search = None
+        self.image_cache_refreshed.emit()
+
+    def revalidate_records(self):
+        """
+        Fetch the records that were stored the longest ago again, records that no longer exist are removed
+        """
+        stale_ids = self.store.stale_ids(
+            datetime.now() - STALE_RECORD_AGE, limit=STALE_RECORDS_PER_ROUND
+        )
+
+        for record_id in stale_ids:
+            try:
+                record = self.fetch_record(record_id, refresh=True)
+            except RecordNotFoundError:
+                self.store.delete(record_id)
+                self.availability.mark_missing(record_id)
+                continue
+
+            self.availability.update_from_record(record)
+            yield
+
+    def clean_up(self):
+        """
+        Keep the disk caches in budget and compact the record store
+        """
+        deleted = self.thumbnail_cache.evict_disk()
+        if deleted:
+            logger.info(f"Evicted {deleted} files from the image caches")
+
+        # VACUUM can't be interrupted, this waits until the app is idle again right before it starts
+        yield
+
+        if not self.store.compact():
+            logger.info("Record store is busy, compacting it on the next round")
+
+        self.availability.save_index()
+        yield
+
+    def run(self):
+        """
+        Run maintenance rounds whenever the app is idle. Every task yields after a unit of work, a pause blocks
+        there until the app is idle again
+        """
+        while self.wait_until_idle():
+            for name, task in self.tasks():
+                logger.debug(f"Maintenance: {name}")
+                self.task_started.emit(name)
+
+                try:
+                    for _ in task():
+                        if not self.wait_until_idle():
+                            return
+                except RequestCancelled:
+                    return
+                except RateLimitedError as e:
+                    logger.warning(f"Maintenance paused, {e}")
+                    self.limiter.pause(RATE_LIMIT_PAUSE)
+                except ConnectionError as e:
+                    # The task is tried again next round
+                    logger.warning(f"Maintenance task {name} failed, {e}")
+                except Exception as e:
+                    # A failing task (e.g. a busy database) is tried again next round, the others still run
+                    logger.exception(f"Maintenance task {name} failed: {e}")
+
+            self.availability.save_index()
+            if self._cancel.wait(MAINTENANCE_INTERVAL):
+                return
+
+
+class MemoryMonitor(QThread):
+    """
+    Background thread that samples the available system memory. Reading it can mean running vm_stat, which is
+    too slow for the UI thread, so only the result goes to the UI and the caches are trimmed there
+    """
+
+    # Available memory in bytes, only emitted when the system is low on memory
+    low_memory = Signal(object)
+
+    def __init__(self, interval=MEMORY_CHECK_INTERVAL):
+        """
+        :param interval: Seconds between two samples
+        """
+        super().__init__()
+        self.interval = interval
+        self._cancel = threading.Event()
+
+    def stop(self):
+        """
+        Ask the thread to stop, it does not wait for the thread
+        """
+        self._cancel.set()
+
+    def run(self):
+        """
+        Sample the memory until stopped
+        """
+        while not self._cancel.is_set():
+            available = available_system_memory()
+            if available is not None and available < LOW_MEMORY_BYTES:
+                self.low_memory.emit(available)
+
+            if self._cancel.wait(self.interval):
+                return
+
+
+class ImageLoaderSignals(QObject):
+    """
+    QRunnable is not a QObject, so the image loader needs a helper to emit its signals
+    """
+
+    loaded = Signal(QImage)
+    failed = Signal(str)
+
+
+class ImageLoader(QRunnable):
+    """
+    Download, decode and downscale a thumbnail on a pool thread, the UI only has to convert the result to a pixmap
+    """
+
+    def __init__(
+        self,
+        image_url: str,
+        width: int,
+        height: int,
+        device_pixel_ratio: float,
+        cache: ThumbnailCache,
+    ):
+        super().__init__()
+        self.image_url = image_url
+        self.device_pixel_ratio = device_pixel_ratio
+        # Decode at the physical pixel size of the label so the image stays sharp on retina screens
+        self.width = round(width * device_pixel_ratio)
+        self.height = round(height * device_pixel_ratio)
+        self.cache = cache
+        self.signals = ImageLoaderSignals()
+
+    def run(self):
+        """
+        Load the thumbnail from the cache or download and decode it in the background
+        """
+        try:
+            image = self.cache.fetch(self.image_url, self.width, self.height)
+
+            if image.isNull():
+                self.signals.failed.emit("Invalid Image")
+                return
+
+            image.setDevicePixelRatio(self.device_pixel_ratio)
+            self.signals.loaded.emit(image)
+
+        except Exception as e:
+            logger.error(f"Failed to load image {self.image_url}: {e}")
+            self.signals.failed.emit("Error Loading Image")
+
+
+class ImageStreamer(QThread):
+    """
+    Stream a full size image in the background and decode it at the size it will be shown at. Only when the user
+    wants to see the actual size it's decoded again at full resolution
+    """
+
+    # All signals carry the generation, so the detail view can drop images of a record it no longer shows
+    # Progress has three variables: generation, bytes received, total bytes
+    progress = Signal(int, int, int)
+    preview_ready = Signal(int, QImage)
+    image_ready = Signal(int, QImage)
+    failed = Signal(int, str)
+
+    def __init__(
+        self,
+        image_url: str,
+        width: int,
+        height: int,
+        device_pixel_ratio: float,
+        cache: ThumbnailCache,
+        generation: int = 0,
+        full_resolution: bool = False,
+    ):
+        super().__init__()
+        self.image_url = image_url
+        self.full_resolution = full_resolution
+        self.device_pixel_ratio = device_pixel_ratio
+        self.width = round(width * device_pixel_ratio)
+        self.height = round(height * device_pixel_ratio)
+        self.cache = cache
+        self.generation = generation
+        self._last_progress = 0.0
+        self._cancel = threading.Event()
+
+    def stop(self):
+        """
+        Ask the thread to stop, this aborts the download. It does not wait for the thread
+        """
+        self._cancel.set()
+
+    def on_chunk(self, received: int, total: int):
+        """
+        Report download progress, throttled to one update per frame
+        """
+        now = time.monotonic()
+        if now - self._last_progress >= FRAME_INTERVAL or received == total:
+            self.progress.emit(self.generation, received, total)
+            self._last_progress = now
+
+    def run(self):
+        """
+        Download and decode the image
+        """
+        try:
+            path = self.cache.download_original(
+                self.image_url,
+                progress_callback=self.on_chunk,
+                cancel_event=self._cancel,
+            )
+            data = path.read_bytes()
+
+            if self._cancel.is_set():
+                return
+
+            preview = decode_scaled(data, self.width, self.height)
+            if preview.isNull():
+                self.failed.emit(self.generation, "Invalid Image")
+                return
+
+            preview.setDevicePixelRatio(self.device_pixel_ratio)
+            self.preview_ready.emit(self.generation, preview)
+
+            if self._cancel.is_set() or not self.full_resolution:
+                return
+
+            # Huge originals are still scaled down, so they stay within Qt's image allocation limit
+            image = decode_scaled(data, ACTUAL_SIZE_LIMIT, ACTUAL_SIZE_LIMIT)
+            if not image.isNull():
+                image.setDevicePixelRatio(self.device_pixel_ratio)
+                self.image_ready.emit(self.generation, image)
+
+        except RequestCancelled:
+            logger.info(f"Stopped streaming {self.image_url}")
+
+        except Exception as e:
+            logger.error(f"Failed to stream image {self.image_url}: {e}")
+            self.failed.emit(self.generation, "Error Loading Image")
+
+
+class ImagePrefetcherSignals(QObject):
+    """
+    Signals of the image prefetcher
+    """
+
+    done = Signal(str)
+
+
+class ImagePrefetcher(QRunnable):
+    """
+    Download a full size image into the cache in the background, so it shows up instantly once it's selected
+    """
+
+    def __init__(self, image_url: str, cache: ThumbnailCache, cancel_event):
+        super().__init__()
+        self.image_url = image_url
+        self.cache = cache
+        self.cancel_event = cancel_event
+        self.signals = ImagePrefetcherSignals()
+
+    def run(self):
+        """
+        Stream the image to disk
+        """
+        try:
+            self.cache.download_original(
+                self.image_url, cancel_event=self.cancel_event
+            )
+            self.signals.done.emit(self.image_url)
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to prefetch {self.image_url}: {e}")
@@ -1,7 +1,35 @@
 import csv
+import heapq
 import json
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import List, Optional
 from tqdm import tqdm
+from src.api.id_set import IdSet
 from src.api.met_api import MetAPI
+from src.api.shared_files import atomic_write
+from src.api.facet_index import write_facet_index
+from src.api.similarity_index import write_similarity_index
+
+# Number of similar records stored per record
+SIMILAR_K = 12
+# Records looked at on either side (by date) in every posting list used to find candidates
+SIMILARITY_WINDOW = 16
+# Only the rarest features of a record are used to find candidates, the others only count towards the score
+CANDIDATE_FEATURES = 3
+# Weight of two records being from the same time, compared to the idf of a shared feature
+DATE_WEIGHT = 2.0
+MEDIUM_STOPWORDS = {"and", "with", "the", "for", "from", "other", "materials"}
+# Roughly how many bars the date histogram of a classification has
+DATE_BINS = 40
+# Bin widths in years, the smallest one that fits DATE_BINS is used
+DATE_BIN_WIDTHS = [1, 2, 5, 10, 20, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+# Part of the records at either end of the date range that go in one open bin, so a few prehistoric objects don't
+# squash the histogram
+DATE_OUTLIERS = 0.02
 
 
 def build_classification_index(csv_path="../MetObjects.txt"):
@@ -30,24 +58,256 @@ def build_classification_index(csv_path="../MetObjects.txt"):
             "reverse_index": reverse_index,
         }
 
-        with open("../data/classification_index.json", "w") as f:
+        with atomic_write("../data/classification_index.json") as f:
             json.dump(result, f, indent=4)
 
         return result
 
 
+def date_histogram_edges(dates: List[int], bins=DATE_BINS) -> List[int]:
+    """
+    Pick the bin edges of a date histogram. Bins are a round number of years wide, the outliers at either end get
+    a bin of their own
+
+    :param dates: Sorted begin dates
+    :param bins: Rough number of bins
+    :returns: Increasing edges, bin i covers edges[i] up to (not including) edges[i + 1]
+    """
+    low = dates[int(len(dates) * DATE_OUTLIERS)]
+    high = dates[len(dates) - 1 - int(len(dates) * DATE_OUTLIERS)]
+
+    width = next(
+        (w for w in DATE_BIN_WIDTHS if (high - low) / w <= bins), DATE_BIN_WIDTHS[-1]
+    )
+    edge = low // width * width
+
+    edges = [dates[0]] if dates[0] < edge else []
+    while edge <= high:
+        edges.append(edge)
+        edge += width
+
+    edges.append(edge)
+    if edge <= dates[-1]:
+        edges.append(dates[-1] + 1)
+
+    return edges
+
+
+def build_facet_index(csv_path="../MetObjects.txt"):
+    """
+    Build the posting lists of the department, classification, artist and culture columns, so the app can browse
+    any combination of them. Empty values are kept as "N/A" like in the classification index
+    """
+    facets = {
+        "department": defaultdict(list),
+        "classification": defaultdict(list),
+        "artist": defaultdict(list),
+        "culture": defaultdict(list),
+    }
+
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in tqdm(reader):
+            object_id = int(row["Object ID"])
+
+            for facet, column in (
+                ("department", "Department"),
+                ("classification", "Classification"),
+                ("culture", "Culture"),
+            ):
+                value = (row.get(column) or "").strip() or "N/A"
+                facets[facet][value].append(object_id)
+
+            # Records can have several artists
+            artists = [
+                a.strip() for a in (row.get("Artist Display Name") or "").split("|")
+            ]
+            for artist in set(a for a in artists if a) or {"N/A"}:
+                facets["artist"][artist].append(object_id)
+
+    write_facet_index("../data/facet_index.bin", facets)
+
+    return facets
+
+
+def build_date_index(csv_path="../MetObjects.txt"):
+    """
+    Sort the records of every classification by begin date and precompute the prefix sums of their date
+    histogram, so the app can count and page the records of any period without fetching anything
+    """
+    records = defaultdict(list)
+
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in tqdm(reader):
+            classification = row.get("Classification")
+            if classification == "":
+                classification = "N/A"
+
+            date = parse_year(row.get("Object Begin Date"))
+            if date is None:
+                # Undated records can't be in any period
+                continue
+
+            records[classification].append((date, int(row["Object ID"])))
+
+    result = {}
+    for classification, entries in records.items():
+        entries.sort()
+        dates = [date for date, _ in entries]
+        edges = date_histogram_edges(dates)
+
+        result[classification] = {
+            "ids": [object_id for _, object_id in entries],
+            "dates": dates,
+            "edges": edges,
+            "prefix": [bisect_left(dates, edge) for edge in edges],
+        }
+
+    with atomic_write("../data/date_index.json") as f:
+        json.dump(result, f)
+
+    return result
+
+
+def parse_year(value: str) -> Optional[int]:
+    """
+    Parse a year column of the CSV
+    :returns: The year or None if it's empty or invalid
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def similarity_features(row: dict) -> List[str]:
+    """
+    Get the features two records can share: artists, medium words, culture and department
+    :param row: A row of the CSV
+    :returns: List of unique features
+    """
+    features = set()
+
+    for artist in (row.get("Artist Display Name") or "").split("|"):
+        if artist.strip():
+            features.add(f"artist:{artist.strip().lower()}")
+
+    for token in re.findall(r"[a-z]+", (row.get("Medium") or "").lower()):
+        if len(token) > 2 and token not in MEDIUM_STOPWORDS:
+            features.add(f"medium:{token}")
+
+    if row.get("Culture"):
+        features.add(f"culture:{row['Culture'].strip().lower()}")
+
+    if row.get("Department"):
+        features.add(f"department:{row['Department'].strip().lower()}")
+
+    return sorted(features)
+
+
+def build_similarity_index(csv_path="../MetObjects.txt", k=SIMILAR_K):
+    """
+    Precompute the k most similar records of every record. Records are similar when they share rare features
+    (weighted by idf) and are from around the same time.
+
+    Comparing every pair is far too slow, so candidates only come from the records closest in date in the posting
+    lists of a record's rarest features.
+    """
+    feature_ids = {}
+    object_ids = []
+    years = []
+    features = []
+
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in tqdm(reader, desc="Reading features"):
+            object_ids.append(int(row["Object ID"]))
+            years.append(parse_year(row.get("Object Begin Date")))
+            features.append(
+                tuple(
+                    feature_ids.setdefault(feature, len(feature_ids))
+                    for feature in similarity_features(row)
+                )
+            )
+
+    total = len(object_ids)
+    document_frequency = Counter(f for record in features for f in record)
+    idf = [0.0] * len(feature_ids)
+    for feature, count in document_frequency.items():
+        idf[feature] = math.log(total / count)
+
+    # Posting lists of record positions, sorted by date so neighbours in a list are close in time
+    postings = defaultdict(list)
+    by_date = sorted(
+        range(total), key=lambda i: years[i] if years[i] is not None else 0
+    )
+    for i in by_date:
+        for feature in features[i]:
+            postings[feature].append(i)
+
+    posting_years = {
+        feature: [years[i] if years[i] is not None else 0 for i in posting]
+        for feature, posting in postings.items()
+    }
+
+    neighbors = {}
+    for i in tqdm(range(total), desc="Finding similar records"):
+        own_features = set(features[i])
+        year = years[i] if years[i] is not None else 0
+
+        # Features nobody else has can't find anything
+        rare_features = sorted(
+            (f for f in own_features if document_frequency[f] > 1),
+            key=lambda f: document_frequency[f],
+        )[:CANDIDATE_FEATURES]
+
+        candidates = set()
+        for feature in rare_features:
+            position = bisect_left(posting_years[feature], year)
+            window = postings[feature][
+                max(0, position - SIMILARITY_WINDOW) : position + SIMILARITY_WINDOW
+            ]
+            candidates.update(window)
+
+        candidates.discard(i)
+
+        scores = []
+        for candidate in candidates:
+            score = sum(idf[f] for f in features[candidate] if f in own_features)
+            if years[i] is not None and years[candidate] is not None:
+                distance = abs(years[i] - years[candidate])
+                score += DATE_WEIGHT * max(0.0, 1 - distance / 100)
+
+            scores.append((score, candidate))
+
+        neighbors[object_ids[i]] = [
+            object_ids[c] for _, c in heapq.nlargest(k, scores)
+        ]
+
+    record_ids = array("i", sorted(neighbors))
+    table = array("i")
+    for record_id in record_ids:
+        row = neighbors[record_id]
+        table.extend(row + [0] * (k - len(row)))
+
+    write_similarity_index("../data/similarity_index.bin", record_ids, table, k)
+
+    return neighbors
+
+
 def validate_index():
     """
     Make sure we all database records are availabe in the index
     """
 
     api = MetAPI()
-    # We need to convert the db ID's to strings so the matching will work
-    all_db_records = set(str(x) for x in api.get_all_records())
+    all_db_records = api.get_all_records()
     with open("../data/classification_index.json", "r") as f:
         data = json.load(f)
 
-        all_local_records = set(data.get("reverse_index").keys())
+        # json keys are strings, the index is compared as compact int sets
+        all_local_records = IdSet(int(x) for x in data.get("reverse_index").keys())
 
         in_db_not_local = all_db_records - all_local_records
         in_local_not_db = all_local_records - all_db_records
@@ -58,4 +318,5 @@ def validate_index():
         print(f"In local but not DB: {len(in_local_not_db)}")
 
 
-validate_index()
+if __name__ == "__main__":
+    validate_index()
@@ -0,0 +1,98 @@
+"""
+Export the records of classifications to JSONL, CSV or Parquet.
+
+Records are streamed from the local record store (or the API for records that are not stored yet), so memory use
+stays the same no matter how many records are exported:
+
+    python -m utils.export --classification Paintings --has-images -o paintings.parquet
+"""
+
+import argparse
+import sys
+from typing import List
+from loguru import logger
+from tqdm import tqdm
+from src.api.classification_index import ClassificationIndex
+from src.api.exporter import WRITERS, export_records
+from src.api.image_availability import ImageAvailabilityIndex
+from src.api.image_record_cache import ImageRecordCache
+
+
+def collect_record_ids(args, image_availability) -> List[int]:
+    """
+    Build the list of records to export from the command line arguments. With --has-images this still includes
+    unverified candidates, the export drops the ones that turn out to have no image
+    """
+    record_ids = set()
+
+    if args.classification:
+        index = ClassificationIndex()
+        for classification in args.classification:
+            records = index.get_records_in_classification(classification)
+            if not records:
+                logger.warning(f"Classification {classification} has no records")
+
+            record_ids.update(int(r) for r in records)
+
+    if args.ids_file:
+        with open(args.ids_file, "r") as f:
+            record_ids.update(int(line) for line in f if line.strip())
+
+    if args.has_images:
+        verified, unverified = image_availability.split_image_records(
+            record_ids, ImageRecordCache().load_cache()
+        )
+        record_ids = verified | unverified
+
+    return sorted(record_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-c",
+        "--classification",
+        action="append",
+        help="Classification to export, can be used multiple times",
+    )
+    parser.add_argument("--ids-file", help="Text file with one record ID per line")
+    parser.add_argument(
+        "--has-images",
+        action="store_true",
+        help="Only export records with a displayable image",
+    )
+    parser.add_argument("-o", "--output", required=True, help="Output file")
+    parser.add_argument(
+        "--format",
+        choices=list(WRITERS),
+        help="Output format, taken from the output file extension by default",
+    )
+    args = parser.parse_args()
+
+    image_availability = ImageAvailabilityIndex()
+    record_ids = collect_record_ids(args, image_availability)
+    if not record_ids:
+        parser.error("Nothing to export, pass --classification or --ids-file")
+
+    with tqdm(total=len(record_ids)) as progress:
+
+        def progress_callback(current, total):
+            progress.update(current - progress.n)
+
+        export_records(
+            record_ids,
+            args.output,
+            export_format=args.format,
+            progress_callback=progress_callback,
+            image_availability=image_availability if args.has_images else None,
+        )
+
+    # The candidates we read are verified now, that saves the app from checking them again
+    image_availability.save_index()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
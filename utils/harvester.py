@@ -0,0 +1,258 @@
+"""
+Mirror full records (and optionally thumbnails) for whole classifications into the local record store.
+
+Progress is checkpointed, so a killed run picks up where it left off:
+
+    python -m utils.harvester --classification Paintings --classification Prints --thumbnails
+    python -m utils.harvester --resume
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+from loguru import logger
+from tqdm import tqdm
+from PySide6 import QtCore
+from src.api.classification_index import ClassificationIndex
+from src.api.image_record_cache import ImageRecordCache
+from src.api.met_api import MetAPI, RecordNotFoundError
+from src.api.rate_limiter import RateLimiter
+from src.api.record_store import RecordStore
+from src.api.shared_files import atomic_write
+from src.api.thumbnail_cache import THUMBNAIL_SIZE, ThumbnailCache
+from src.dir_utils.dirs import get_app_data_dir
+
+
+class Harvester:
+    """
+    Fetch records concurrently within the rate limit and write them into the local record store
+    """
+
+    def __init__(
+        self,
+        store: RecordStore,
+        checkpoint_path=None,
+        workers: int = 8,
+        rate: float = 40,
+        thumbnails: bool = False,
+        device_pixel_ratio: float = 2.0,
+    ) -> None:
+        if checkpoint_path is None:
+            checkpoint_path = get_app_data_dir() / "harvest_checkpoint.json"
+
+        self.api = MetAPI()
+        self.store = store
+        self.checkpoint_path = Path(checkpoint_path)
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.thumbnails = thumbnails
+        self.thumbnail_size = round(THUMBNAIL_SIZE * device_pixel_ratio)
+        self.thumbnail_cache = None
+        self.app = None
+        self.job = {}
+
+    def start(self, record_ids: List[int]):
+        """
+        Start a new harvest, replacing any previous checkpoint
+
+        :param record_ids: Records to harvest
+        """
+        self.job = {
+            "created_on": datetime.now().isoformat(),
+            "record_ids": sorted(set(int(r) for r in record_ids)),
+            "thumbnails": self.thumbnails,
+            "thumbnail_size": self.thumbnail_size,
+            "failed": [],
+        }
+        self.save_checkpoint()
+        self.run()
+
+    def resume(self):
+        """
+        Continue the harvest stored in the checkpoint
+        """
+        if not self.checkpoint_path.exists():
+            raise FileNotFoundError(f"No checkpoint found at {self.checkpoint_path}")
+
+        with open(self.checkpoint_path, "r") as f:
+            self.job = json.load(f)
+
+        self.thumbnails = self.job.get("thumbnails", False)
+        self.thumbnail_size = self.job.get("thumbnail_size", self.thumbnail_size)
+        self.run()
+
+    def save_checkpoint(self):
+        """
+        Write the checkpoint to a temporary file first so a kill mid write never corrupts it
+        """
+        with atomic_write(self.checkpoint_path) as f:
+            json.dump(self.job, f)
+
+    def pending_ids(self) -> List[int]:
+        """
+        Work out what is left to do. The record store itself is the source of truth for finished records
+
+        :returns: List of record IDs that still need fetching
+        """
+        failed = set(self.job.get("failed", []))
+        record_ids = [r for r in self.job["record_ids"] if r not in failed]
+        stored = self.store.existing_ids(record_ids)
+
+        pending = [r for r in record_ids if r not in stored]
+        if self.thumbnails:
+            # Stored records might still be missing their thumbnail
+            for record_id in stored:
+                record = self.store.get(record_id)
+                url = record.get("primaryImageSmall")
+                if url and not self.thumbnail_cache.thumbnail_path(
+                    url, self.thumbnail_size, self.thumbnail_size
+                ).exists():
+                    pending.append(record_id)
+
+        return pending
+
+    def harvest_record(self, record_id: int) -> Dict:
+        """
+        Fetch a single record (and its thumbnail) with retries
+
+        :param record_id: ID of the record
+        :returns: The record data
+        """
+        record = self.store.get_or_fetch(
+            record_id,
+            lambda: self.api.get_single_record_with_retries(record_id, self.limiter),
+        )
+
+        url = record.get("primaryImageSmall")
+        if self.thumbnails and url:
+            self.thumbnail_cache.fetch(url, self.thumbnail_size, self.thumbnail_size)
+
+        return record
+
+    def run(self):
+        """
+        Harvest every pending record
+        """
+        if self.thumbnails:
+            # Qt image plugins are loaded through the application object
+            self.app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+            self.thumbnail_cache = ThumbnailCache()
+
+        pending = self.pending_ids()
+        total = len(self.job["record_ids"])
+        logger.info(f"{total - len(pending)}/{total} records already harvested")
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {executor.submit(self.harvest_record, r): r for r in pending}
+
+        try:
+            for i, future in enumerate(
+                tqdm(as_completed(futures), total=len(futures)), start=1
+            ):
+                record_id = futures[future]
+                try:
+                    future.result()
+                except RecordNotFoundError:
+                    self.job["failed"].append(record_id)
+                except Exception as e:
+                    logger.error(f"Failed to harvest {record_id}: {e}")
+
+                if i % 500 == 0:
+                    self.save_checkpoint()
+
+        except KeyboardInterrupt:
+            logger.info("Harvest interrupted, run with --resume to continue")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self.save_checkpoint()
+
+        executor.shutdown()
+        logger.info(f"Harvest done, {self.store.count()} records in the store")
+
+
+def collect_record_ids(args) -> List[int]:
+    """
+    Build the list of records to harvest from the command line arguments
+    """
+    record_ids = set()
+
+    if args.classification:
+        index = ClassificationIndex()
+        for classification in args.classification:
+            records = index.get_records_in_classification(classification)
+            if not records:
+                logger.warning(f"Classification {classification} has no records")
+
+            record_ids.update(int(r) for r in records)
+
+    if args.ids_file:
+        with open(args.ids_file, "r") as f:
+            record_ids.update(int(line) for line in f if line.strip())
+
+    if args.has_images:
+        record_ids &= ImageRecordCache().load_cache()
+
+    return sorted(record_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-c",
+        "--classification",
+        action="append",
+        help="Classification to harvest, can be used multiple times",
+    )
+    parser.add_argument("--ids-file", help="Text file with one record ID per line")
+    parser.add_argument(
+        "--has-images",
+        action="store_true",
+        help="Only harvest records marked as having images",
+    )
+    parser.add_argument(
+        "--thumbnails", action="store_true", help="Also cache thumbnails"
+    )
+    parser.add_argument(
+        "--dpr",
+        type=float,
+        default=2.0,
+        help="Device pixel ratio of the screen the thumbnails are for",
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--rate", type=float, default=40, help="Maximum requests per second"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue the last harvest"
+    )
+    args = parser.parse_args()
+
+    harvester = Harvester(
+        RecordStore(),
+        workers=args.workers,
+        rate=args.rate,
+        thumbnails=args.thumbnails,
+        device_pixel_ratio=args.dpr,
+    )
+
+    if args.resume:
+        harvester.resume()
+        return
+
+    record_ids = collect_record_ids(args)
+    if not record_ids:
+        parser.error("Nothing to harvest, pass --classification or --ids-file")
+
+    harvester.start(record_ids)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)